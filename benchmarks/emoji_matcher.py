@@ -0,0 +1,86 @@
+"""
+Per-message cost of finding guild emojis in message content.
+
+Compares the old `str(emoji) in content` scan over every guild emoji with
+the regex + id lookup done by `EmojiIndex`.
+
+    python -m benchmarks.emoji_matcher [emoji count] [messages]
+"""
+import random
+import sys
+import timeit
+from dataclasses import dataclass
+
+from lambo.utils.emoji_index import EmojiIndex
+
+
+@dataclass(frozen=True)
+class FakeEmoji:
+    id: int
+    name: str
+    animated: bool = False
+
+    def __str__(self) -> str:
+        return f"<{'a' if self.animated else ''}:{self.name}:{self.id}>"
+
+
+@dataclass
+class FakeGuild:
+    id: int
+    emojis: tuple[FakeEmoji, ...]
+
+
+def scan_emojis(string: str, guild: FakeGuild) -> set[str]:
+    emojis = set()
+    for emoji in guild.emojis:
+        if str(emoji) in string:
+            emojis.add(emoji.name)
+    return emojis
+
+
+def make_messages(guild: FakeGuild, count: int) -> list[str]:
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur"]
+    messages = []
+    for _ in range(count):
+        parts = random.choices(words, k=random.randint(3, 30))
+        for _ in range(random.choice((0, 0, 0, 1, 2, 5))):
+            emoji = str(random.choice(guild.emojis))
+            parts.insert(random.randrange(len(parts) + 1), emoji)
+        messages.append(" ".join(parts))
+    return messages
+
+
+def main(emoji_count: int = 400, message_count: int = 2000) -> None:
+    random.seed(0)
+    guild = FakeGuild(
+        id=1,
+        emojis=tuple(
+            FakeEmoji(id=10**17 + i, name=f"emoji_{i}", animated=i % 7 == 0)
+            for i in range(emoji_count)
+        ),
+    )
+    messages = make_messages(guild, message_count)
+    index = EmojiIndex()
+
+    def before() -> None:
+        for message in messages:
+            scan_emojis(message, guild)
+
+    def after() -> None:
+        for message in messages:
+            {emoji.name for emoji in index.find(guild, message)}  # type: ignore
+
+    for message in messages:
+        expected = scan_emojis(message, guild)
+        found = {emoji.name for emoji in index.find(guild, message)}  # type: ignore
+        assert expected == found, (message, expected, found)
+
+    print(f"{emoji_count} guild emojis, {message_count} messages")
+    for name, func in (("scan", before), ("index", after)):
+        runs = 5
+        best = min(timeit.repeat(func, number=1, repeat=runs))
+        print(f"{name:>6}: {best / message_count * 1e6:8.2f} us/message")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
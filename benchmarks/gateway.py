@@ -0,0 +1,511 @@
+"""
+Replays a synthetic message stream through `CustomClient` with every cog
+loaded, against fake guilds and a no-op HTTP layer.
+
+Reports throughput, per-message latency (from dispatch until every task it
+started is done), and for each cog: latency, database queries, errors and
+the memory still held by allocations made in its module.
+
+    python -m benchmarks.gateway --messages 5000 --rate 0
+    python -m benchmarks.gateway --messages 2000 --rate 500 --emoji-ratio 0.5
+
+`--rate 0` replays messages one after another, a positive rate starts them
+on a fixed schedule (messages per second) whether or not earlier ones are
+done. Memory tracing slows everything down, use `--no-memory` for timings
+that compare with production.
+"""
+import argparse
+import asyncio
+import contextvars
+import itertools
+import logging
+import random
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+import discord
+from discord.ext.commands import Context
+from discord.http import HTTPClient, Route
+from discord.utils import time_snowflake
+from tortoise import Tortoise
+
+from lambo.config import Settings
+from lambo.custom_client import CustomClient
+from lambo.migrations import migrate
+from lambo.models import AddReactionModel, StickyMessageModel
+from lambo.utils.metrics import add_query_listener, install_query_counter
+
+# Guild and channel ids the strata cogs are limited to, so they take part.
+STRATA_GUILD_ID = 211261411119202305
+SUPPORT_GUILD_ID = 950868480041824266
+STRATA_CHANNEL_IDS = (412146574823784468, 412193591922786304)
+STRATA_ROLE_IDS = (953718724614037525,)
+BOT_USER_ID = 10**17
+OWNER_ID = 10**17 + 1
+
+current_cog: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "current_cog", default="setup"
+)
+current_message: contextvars.ContextVar[
+    Optional[list[asyncio.Task]]
+] = contextvars.ContextVar("current_message", default=None)
+
+
+_sequence = itertools.count(1)
+
+
+def snowflake() -> int:
+    return time_snowflake(datetime.now(timezone.utc)) + next(_sequence)
+
+
+def user_payload(user_id: int, name: str, bot: bool = False) -> dict[str, Any]:
+    return {
+        "id": str(user_id),
+        "username": name,
+        "discriminator": "0001",
+        "avatar": None,
+        "bot": bot,
+    }
+
+
+def message_payload(
+    channel_id: int, guild_id: Optional[int], author: dict[str, Any], content: str
+) -> dict[str, Any]:
+    payload = {
+        "id": str(snowflake()),
+        "channel_id": str(channel_id),
+        "author": author,
+        "content": content,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+    }
+    if guild_id is not None:
+        payload["guild_id"] = str(guild_id)
+    return payload
+
+
+class FakeHTTPClient(HTTPClient):
+    """
+    Answers every request locally. Sending or editing a message returns a
+    message payload, everything else returns nothing.
+    """
+
+    requests: Counter[str]
+
+    def __init__(self, bot_user: dict[str, Any]) -> None:
+        super().__init__()
+        self.requests = Counter()
+        self.bot_user = bot_user
+
+    async def request(self, route: Route, **kwargs: Any) -> Any:
+        self.requests[f"{route.method} {route.path}"] += 1
+        if route.method in ("POST", "PATCH") and route.path.startswith(
+            "/channels/{channel_id}/messages"
+        ):
+            content = (kwargs.get("json") or {}).get("content") or ""
+            return message_payload(
+                route.channel_id, None, self.bot_user, content  # type: ignore
+            )
+        return None
+
+    async def close(self) -> None:
+        pass
+
+
+@dataclass
+class FakeGuild:
+    id: int
+    name: str
+    channel_ids: list[int]
+    role_ids: list[int]
+    member_ids: list[int]
+    emoji_strings: list[str]
+
+    def payload(self, emoji_ids: list[int]) -> dict[str, Any]:
+        joined_at = datetime.now(timezone.utc).isoformat()
+        return {
+            "id": str(self.id),
+            "name": self.name,
+            "owner_id": str(OWNER_ID),
+            "member_count": len(self.member_ids) + 1,
+            "roles": [
+                {
+                    "id": str(role_id),
+                    "name": "@everyone" if role_id == self.id else f"role-{i}",
+                    "color": 0,
+                    "hoist": False,
+                    "position": i,
+                    "permissions": "0",
+                    "managed": False,
+                    "mentionable": False,
+                }
+                for i, role_id in enumerate(self.role_ids)
+            ],
+            "channels": [
+                {
+                    "id": str(channel_id),
+                    "type": 0,
+                    "name": f"channel-{i}",
+                    "position": i,
+                    "guild_id": str(self.id),
+                    "permission_overwrites": [],
+                    "nsfw": False,
+                    "parent_id": None,
+                }
+                for i, channel_id in enumerate(self.channel_ids)
+            ],
+            "members": [
+                {
+                    "user": user_payload(member_id, f"member-{member_id % 10**6}"),
+                    "roles": [str(random.choice(self.role_ids[1:]))],
+                    "joined_at": joined_at,
+                    "deaf": False,
+                    "mute": False,
+                }
+                for member_id in self.member_ids
+            ]
+            + [
+                {
+                    "user": user_payload(BOT_USER_ID, "lambo", bot=True),
+                    "roles": [],
+                    "joined_at": joined_at,
+                    "deaf": False,
+                    "mute": False,
+                }
+            ],
+            "emojis": [
+                {
+                    "id": str(emoji_id),
+                    "name": f"emoji_{i}",
+                    "animated": i % 7 == 0,
+                    "roles": [],
+                    "require_colons": True,
+                    "managed": False,
+                    "available": True,
+                }
+                for i, emoji_id in enumerate(emoji_ids)
+            ],
+        }
+
+
+def make_guilds(
+    count: int, channels: int, members: int, roles: int, emojis: int
+) -> tuple[list[FakeGuild], list[dict[str, Any]]]:
+    ids = [STRATA_GUILD_ID, SUPPORT_GUILD_ID]
+    ids += [snowflake() for _ in range(count - len(ids))]
+    guilds: list[FakeGuild] = []
+    payloads: list[dict[str, Any]] = []
+    for guild_id in ids[: max(count, 1)]:
+        channel_ids = [snowflake() for _ in range(channels)]
+        if guild_id == STRATA_GUILD_ID:
+            channel_ids[: len(STRATA_CHANNEL_IDS)] = STRATA_CHANNEL_IDS
+        role_ids = [guild_id] + [snowflake() for _ in range(roles)]
+        if guild_id == STRATA_GUILD_ID:
+            role_ids[1 : len(STRATA_ROLE_IDS) + 1] = STRATA_ROLE_IDS
+        emoji_ids = [snowflake() for _ in range(emojis)]
+        guild = FakeGuild(
+            id=guild_id,
+            name=f"guild-{len(guilds)}",
+            channel_ids=channel_ids,
+            role_ids=role_ids,
+            member_ids=[OWNER_ID] + [snowflake() for _ in range(members - 1)],
+            emoji_strings=[
+                f"<{'a' if i % 7 == 0 else ''}:emoji_{i}:{emoji_id}>"
+                for i, emoji_id in enumerate(emoji_ids)
+            ],
+        )
+        guilds.append(guild)
+        payloads.append(guild.payload(emoji_ids))
+    return guilds, payloads
+
+
+def make_messages(
+    guilds: list[FakeGuild],
+    count: int,
+    emoji_ratio: float,
+    command_ratio: float,
+    commands: list[str],
+    prefix: str,
+) -> list[dict[str, Any]]:
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur"]
+    messages = []
+    for _ in range(count):
+        guild = random.choice(guilds)
+        author = user_payload(random.choice(guild.member_ids), "member")
+        roll = random.random()
+        if roll < command_ratio:
+            role = random.choice(guild.role_ids[1:])
+            content = prefix + random.choice(commands).format(role=role)
+        else:
+            parts = random.choices(words, k=random.randint(3, 30))
+            if roll < command_ratio + emoji_ratio:
+                for _ in range(random.randint(1, 5)):
+                    emoji = random.choice(guild.emoji_strings)
+                    parts.insert(random.randrange(len(parts) + 1), emoji)
+            content = " ".join(parts)
+        channel_id = random.choice(guild.channel_ids)
+        messages.append(message_payload(channel_id, guild.id, author, content))
+    return messages
+
+
+@dataclass
+class CogStats:
+    latencies: list[float] = field(default_factory=list)
+    queries: int = 0
+    errors: int = 0
+    memory: int = 0
+
+
+class Recorder:
+    stats: defaultdict[str, CogStats]
+    message_latencies: list[float]
+
+    def __init__(self, bot: CustomClient) -> None:
+        self.stats = defaultdict(CogStats)
+        self.message_latencies = []
+        self._schedule_event = bot._schedule_event
+        bot._schedule_event = self.schedule_event  # type: ignore
+        bot.on_error = self.on_error  # type: ignore
+        bot.on_command_error = self.on_command_error  # type: ignore
+        bot.before_invoke(self.before_invoke)
+        bot.after_invoke(self.after_invoke)
+
+    def count_query(self) -> None:
+        self.stats[current_cog.get()].queries += 1
+
+    def schedule_event(
+        self, coro: Any, event_name: str, *args: Any, **kwargs: Any
+    ) -> asyncio.Task:
+        # Pipeline stages are named "<cog>.<method>".
+        cog = event_name.split(".", 1)[0]
+
+        async def timed(*args: Any, **kwargs: Any) -> None:
+            current_cog.set(cog)
+            start = time.perf_counter()
+            try:
+                await coro(*args, **kwargs)
+            finally:
+                self.stats[cog].latencies.append(time.perf_counter() - start)
+
+        task = self._schedule_event(timed, event_name, *args, **kwargs)
+        tasks = current_message.get()
+        if tasks is not None:
+            tasks.append(task)
+        return task
+
+    async def on_error(self, event_method: str, *args: Any, **kwargs: Any) -> None:
+        cog = event_method.split(".", 1)[0]
+        if not self.stats[cog].errors:
+            logging.exception("First error in %s", event_method)
+        self.stats[cog].errors += 1
+
+    async def on_command_error(self, ctx: Context, error: Exception) -> None:
+        cog = ctx.cog.qualified_name if ctx.cog else "commands"
+        if not self.stats[cog].errors:
+            logging.error("First error in %s", ctx.command, exc_info=error)
+        self.stats[cog].errors += 1
+
+    # Commands run inside the on_message task, these hooks move their time
+    # and queries over to the command's cog.
+    async def before_invoke(self, ctx: Context) -> None:
+        current_cog.set(ctx.cog.qualified_name if ctx.cog else "commands")
+        ctx.benchmark_start = time.perf_counter()  # type: ignore
+
+    async def after_invoke(self, ctx: Context) -> None:
+        elapsed = time.perf_counter() - ctx.benchmark_start  # type: ignore
+        self.stats[current_cog.get()].latencies.append(elapsed)
+
+    async def replay(self, bot: CustomClient, data: dict[str, Any]) -> None:
+        channel = bot.get_channel(int(data["channel_id"]))
+        message = discord.Message(
+            state=bot._connection, channel=channel, data=data  # type: ignore
+        )
+        tasks: list[asyncio.Task] = []
+        current_message.set(tasks)
+        start = time.perf_counter()
+        bot.dispatch("message", message)
+        while pending := [task for task in tasks if not task.done()]:
+            await asyncio.wait(pending)
+        self.message_latencies.append(time.perf_counter() - start)
+
+
+async def build_bot(args: argparse.Namespace) -> tuple[CustomClient, list[FakeGuild]]:
+    settings = Settings(
+        db_url=args.db_url,
+        token="benchmark",
+        non_default_extensions=["lambo.cogs.strata"],
+        non_default_models=["lambo.models.strata_models"],
+    )
+    bot = CustomClient(settings)
+    bot.owner_id = OWNER_ID
+    bot_user = user_payload(BOT_USER_ID, "lambo", bot=True)
+    http = FakeHTTPClient(bot_user)
+    bot.http = http
+    state = bot._connection
+    state.http = http
+    state.user = discord.ClientUser(state=state, data=bot_user)  # type: ignore
+
+    guilds, payloads = make_guilds(
+        args.guilds, args.channels, args.members, args.roles, args.emojis
+    )
+    for payload in payloads:
+        state._add_guild(discord.Guild(data=payload, state=state))  # type: ignore
+
+    await Tortoise.init(
+        config={
+            "connections": {"default": settings.db_connection()},
+            "apps": {
+                "lambo": {
+                    "models": [*settings.models, *settings.non_default_models],
+                    "default_connection": "default",
+                }
+            },
+        }
+    )
+    install_query_counter()
+    await migrate()
+    for guild in guilds:
+        for channel_id in guild.channel_ids[: args.sticky_channels]:
+            await StickyMessageModel.create(
+                channel_id=channel_id,
+                bot_last_message_id=snowflake(),
+                message_content="Please keep it on topic.",
+            )
+        for channel_id in guild.channel_ids[: args.reaction_channels]:
+            emoji_id = int(guild.emoji_strings[0].rstrip(">").rsplit(":", 1)[1])
+            await AddReactionModel.create(channel_id=channel_id, emoji_id=emoji_id)
+
+    for extension in [*settings.extensions, *settings.non_default_extensions]:
+        bot.load_extension(extension)
+    bot._ready.set()
+    # Lets the cogs load their state from the database.
+    await asyncio.sleep(0.5)
+    return bot, guilds
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def format_ms(seconds: float) -> str:
+    return f"{seconds * 1000:8.3f}"
+
+
+async def run(args: argparse.Namespace) -> None:
+    random.seed(args.seed)
+    bot, guilds = await build_bot(args)
+    recorder = Recorder(bot)
+    add_query_listener(recorder.count_query)
+
+    messages = make_messages(
+        guilds,
+        args.messages,
+        args.emoji_ratio,
+        args.command_ratio,
+        args.commands,
+        bot._settings.prefix,
+    )
+    if args.memory:
+        tracemalloc.start()
+        baseline = tracemalloc.take_snapshot()
+
+    start = time.perf_counter()
+    if args.rate > 0:
+        replays = []
+        for i, data in enumerate(messages):
+            delay = start + i / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            replays.append(asyncio.create_task(recorder.replay(bot, data)))
+        await asyncio.gather(*replays)
+    else:
+        for data in messages:
+            await recorder.replay(bot, data)
+    elapsed = time.perf_counter() - start
+
+    current_cog.set("shutdown")
+    await bot.close()
+    if args.memory:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        for stat in snapshot.compare_to(baseline, "filename"):
+            filename = stat.traceback[0].filename.replace("\\", "/")
+            if "/lambo/cogs/" in filename:
+                for cog in bot.cogs.values():
+                    if type(cog).__module__.replace(".", "/") in filename:
+                        recorder.stats[cog.qualified_name].memory += stat.size_diff
+    await Tortoise.close_connections()
+
+    latencies = recorder.message_latencies
+    print(
+        f"{len(messages)} messages in {elapsed:.2f}s "
+        f"({len(messages) / elapsed:.0f} msg/s), "
+        f"{len(guilds)} guilds, rate {args.rate or 'unbounded'}"
+    )
+    print(
+        f"per message: p50 {format_ms(percentile(latencies, 0.5))} ms, "
+        f"p99 {format_ms(percentile(latencies, 0.99))} ms"
+    )
+    if args.memory:
+        print(f"traced memory peak: {peak / 1024:.0f} KiB")
+    print()
+    print(
+        f"{'cog':<24}{'runs':>8}{'p50 ms':>10}{'p99 ms':>10}"
+        f"{'queries':>9}{'errors':>8}{'mem KiB':>9}"
+    )
+    for name, stats in sorted(recorder.stats.items()):
+        print(
+            f"{name:<24}{len(stats.latencies):>8}"
+            f"{format_ms(percentile(stats.latencies, 0.5)):>10}"
+            f"{format_ms(percentile(stats.latencies, 0.99)):>10}"
+            f"{stats.queries:>9}{stats.errors:>8}{stats.memory / 1024:>9.0f}"
+        )
+    print()
+    print("HTTP requests:")
+    for route, count in bot.http.requests.most_common():  # type: ignore
+        print(f"{count:>8}  {route}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=0.0, help="messages/s")
+    parser.add_argument("--guilds", type=int, default=3)
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--members", type=int, default=500)
+    parser.add_argument("--roles", type=int, default=30)
+    parser.add_argument("--emojis", type=int, default=200)
+    parser.add_argument("--emoji-ratio", type=float, default=0.3)
+    parser.add_argument("--command-ratio", type=float, default=0.02)
+    parser.add_argument(
+        "--commands",
+        nargs="+",
+        default=["emojis rank", "role id {role}"],
+        help="commands without prefix, {role} is replaced with a role id",
+    )
+    parser.add_argument("--sticky-channels", type=int, default=2)
+    parser.add_argument("--reaction-channels", type=int, default=2)
+    parser.add_argument("--db-url", default="sqlite://:memory:")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", dest="memory", action="store_false")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
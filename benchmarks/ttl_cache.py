@@ -0,0 +1,61 @@
+"""
+TTLCache operations with a large number of live keys.
+
+    python -m benchmarks.ttl_cache [keys]
+"""
+import sys
+import time
+
+from lambo.utils.caches import TTLCache
+
+
+def timed(name: str, count: int, func) -> None:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    per_op = elapsed / count * 1e6
+    print(f"{name:>12}: {elapsed * 1000:8.1f} ms total, {per_op:6.2f} us/op")
+
+
+def main(keys: int = 100_000) -> None:
+    print(f"{keys} keys")
+    cache: TTLCache[int, int] = TTLCache(60)
+
+    def set_all() -> None:
+        for i in range(keys):
+            cache[i] = i
+
+    def contains_all() -> None:
+        for i in range(keys):
+            i in cache
+
+    def get_all() -> None:
+        for i in range(keys):
+            cache[i]
+
+    def overwrite_all() -> None:
+        for i in range(keys):
+            cache[i] = i + 1
+
+    timed("set", keys, set_all)
+    timed("contains", keys, contains_all)
+    timed("get", keys, get_all)
+    timed("overwrite", keys, overwrite_all)
+
+    expiring: TTLCache[int, int] = TTLCache(0.5)
+    for i in range(keys):
+        expiring[i] = i
+    time.sleep(0.6)
+    timed("expire all", keys, lambda: expiring.prune_expired())
+
+    bounded: TTLCache[int, int] = TTLCache(60, max_size=keys // 10)
+
+    def set_bounded() -> None:
+        for i in range(keys):
+            bounded[i] = i
+
+    timed("set bounded", keys, set_bounded)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
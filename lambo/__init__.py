@@ -2,6 +2,8 @@ __version__ = "0.1.0"
 
 
 import asyncio
+import logging
+import signal
 
 import tortoise.exceptions
 from discord import ExtensionFailed, ExtensionNotFound
@@ -9,29 +11,64 @@ from discord.ext.commands import errors
 from tortoise import Tortoise
 
 from lambo.config import Settings
-from lambo.custom_client import CustomClient
+from lambo.custom_client import LOGGER_FORMAT, CustomClient
+from lambo.migrations import migrate
+from lambo.utils.metrics import install_query_counter
+from lambo.utils.startup import StartupProfiler
 
-config = Settings()
-bot = CustomClient(config)
 
-
-async def run():
-    await Tortoise.init(
-        db_url=config.db_url,
-        modules={"lambo": [*config.models, *config.non_default_models]},
-    )
-    await Tortoise.generate_schemas()
+async def run(bot: CustomClient, config: Settings, profiler: StartupProfiler):
+    with profiler.phase("Tortoise.init"):
+        await Tortoise.init(
+            config={
+                "connections": {"default": config.db_connection()},
+                "apps": {
+                    "lambo": {
+                        "models": [*config.models, *config.non_default_models],
+                        "default_connection": "default",
+                    }
+                },
+            }
+        )
+        install_query_counter()
+    with profiler.phase("migrate"):
+        await migrate()
     extensions = [*config.extensions, *config.non_default_extensions]
     for extension in extensions:
-        bot.load_extension(extension)
+        with profiler.phase(f"load_extension({extension})"):
+            bot.load_extension(extension)
+
+    ready_logged = False
+
+    async def log_ready():
+        nonlocal ready_logged
+        if not ready_logged:
+            ready_logged = True
+            profiler.mark("Gateway ready")
 
+    bot.add_listener(log_ready, "on_ready")
     await bot.start()
 
 
 def main():
+    logging.basicConfig(level=logging.INFO, format=LOGGER_FORMAT)
+    profiler = StartupProfiler()
+    with profiler.phase("Settings"):
+        config = Settings()
+    with profiler.phase("CustomClient"):
+        bot = CustomClient(config)
     loop = asyncio.get_event_loop()
+    closing: list[asyncio.Task] = []
     try:
-        loop.run_until_complete(run())
+        # `docker stop` sends SIGTERM, closing the bot lets the shutdown
+        # hooks flush buffered writes before the process exits.
+        loop.add_signal_handler(
+            signal.SIGTERM, lambda: closing.append(loop.create_task(bot.close()))
+        )
+    except NotImplementedError:
+        pass
+    try:
+        loop.run_until_complete(run(bot, config, profiler))
     except (
         KeyboardInterrupt,
         ModuleNotFoundError,
@@ -40,11 +77,11 @@ def main():
         tortoise.exceptions.ConfigurationError,
     ) as e:
         print(e)
-        loop.run_until_complete(Tortoise.close_connections())
-        loop.run_until_complete(bot.close())
     finally:
-        if loop.is_running():
-            loop.close()
+        # Closing the bot flushes pending writes, so the database goes last.
+        loop.run_until_complete(asyncio.gather(*closing, bot.close()))
+        loop.run_until_complete(Tortoise.close_connections())
+        loop.close()
 
 
 if __name__ == "__main__":
@@ -1,17 +1,20 @@
+from importlib import import_module
+
 from lambo.custom_client import CustomClient
 
-from .add_reaction import setup as add_reaction_setup
-from .count_emoji import setup as count_emoji_setup
-from .giveaway import setup as giveaway_setup
-from .moderation_utils import setup as moderation_utils_setup
-from .sticky_message import setup as sticky_message_setup
-from .utilities import setup as utilities_setup
+# Loading `lambo.cogs` loads all of these. List single modules, for example
+# `lambo.cogs.giveaway`, in `Settings.extensions` to import only those.
+EXTENSIONS = (
+    "count_emoji",
+    "giveaway",
+    "moderation_utils",
+    "sticky_message",
+    "utilities",
+    "add_reaction",
+    "diagnostics",
+)
 
 
 def setup(bot: CustomClient) -> None:
-    count_emoji_setup(bot)
-    giveaway_setup(bot)
-    moderation_utils_setup(bot)
-    sticky_message_setup(bot)
-    utilities_setup(bot)
-    add_reaction_setup(bot)
+    for name in EXTENSIONS:
+        import_module(f"{__name__}.{name}").setup(bot)
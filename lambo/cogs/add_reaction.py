@@ -6,14 +6,55 @@ import tortoise.transactions
 from discord.ext.commands import Cog, Context, command, group, is_owner
 
 from lambo import CustomClient
+from lambo.message_pipeline import message_stage
 from lambo.models import AddReactionModel, StickyMessageModel
 
 
 class AddReactionCog(Cog, name="Add Reaction"):
     bot: CustomClient
+    # channel id -> emoji ids, as configured
+    emoji_ids: dict[int, list[int]]
+    # channel id -> emojis the bot can currently use
+    reactions: dict[int, list[discord.Emoji]]
 
     def __init__(self, bot: CustomClient) -> None:
         self.bot = bot
+        self.emoji_ids = {}
+        self.reactions = {}
+        self._load_task = self.bot.loop.create_task(self.load_reactions())
+
+    def cog_unload(self) -> None:
+        self._load_task.cancel()
+
+    async def load_reactions(self) -> None:
+        models = await AddReactionModel.all()
+        for model in models:
+            self.emoji_ids.setdefault(model.channel_id, []).append(model.emoji_id)
+        await self.bot.wait_until_ready()
+        self.resolve_emojis()
+
+    def resolve_emojis(self, channel_id: typing.Optional[int] = None) -> None:
+        channel_ids = list(self.emoji_ids) if channel_id is None else [channel_id]
+        for channel_id in channel_ids:
+            emojis = [
+                emoji
+                for emoji_id in self.emoji_ids.get(channel_id, [])
+                if (emoji := self.bot.get_emoji(emoji_id)) is not None
+            ]
+            # Updated in place, the message pipeline holds a reference to it.
+            if emojis:
+                self.reactions[channel_id] = emojis
+            else:
+                self.reactions.pop(channel_id, None)
+
+    @Cog.listener()
+    async def on_guild_emojis_update(
+        self,
+        guild: discord.Guild,
+        before: typing.Sequence[discord.Emoji],
+        after: typing.Sequence[discord.Emoji],
+    ):
+        self.resolve_emojis()
 
     @is_owner()
     @group(name="addreaction", invoke_without_command=False)
@@ -29,6 +70,8 @@ class AddReactionCog(Cog, name="Add Reaction"):
             await ctx.reply("This reaction is already set.")
             return
         await AddReactionModel.create(channel_id=channel.id, emoji_id=emoji.id)
+        self.emoji_ids.setdefault(channel.id, []).append(emoji.id)
+        self.resolve_emojis(channel.id)
 
     @add_reaction.command("remove")
     @tortoise.transactions.atomic()
@@ -38,23 +81,24 @@ class AddReactionCog(Cog, name="Add Reaction"):
         removed = await AddReactionModel.filter(
             channel_id=channel.id, emoji_id=emoji.id
         ).delete()
+        emoji_ids = [
+            emoji_id
+            for emoji_id in self.emoji_ids.get(channel.id, [])
+            if emoji_id != emoji.id
+        ]
+        if emoji_ids:
+            self.emoji_ids[channel.id] = emoji_ids
+        else:
+            self.emoji_ids.pop(channel.id, None)
+        self.resolve_emojis(channel.id)
         await ctx.reply(f"Removed {removed} reactions.")
 
-    @Cog.listener("on_message")
-    @tortoise.transactions.atomic()
-    async def on_message(self, message: discord.Message):
-        if message.author.bot:
-            return
-        emoji_model = await AddReactionModel.filter(channel_id=message.channel.id)
-        if not emoji_model:
+    @message_stage(channel_ids="reactions")
+    async def add_reactions(self, message: discord.Message):
+        emojis = self.reactions.get(message.channel.id)
+        if not emojis:
             return
-        emojis = map(self.bot.get_emoji, map(lambda m: int(m.emoji_id), emoji_model))
-        actions = []
-        for emoji in emojis:
-            if not emoji:
-                continue
-            actions.append(message.add_reaction(emoji))
-        await asyncio.gather(*actions)
+        await asyncio.gather(*[message.add_reaction(emoji) for emoji in emojis])
 
 
 def setup(bot: CustomClient):
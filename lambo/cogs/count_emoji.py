@@ -1,35 +1,85 @@
+import asyncio
 import typing
+from collections import Counter
 from datetime import datetime
 
 import discord
-from discord.ext.commands import Cog, Context, FlagConverter, flag, group, is_owner
+from discord.ext.commands import (
+    Cog,
+    Context,
+    FlagConverter,
+    Greedy,
+    flag,
+    group,
+    is_owner,
+)
 from discord.utils import DISCORD_EPOCH
-from tortoise.functions import Count
+from tortoise.functions import Sum
+from tortoise.transactions import in_transaction
 
 from lambo import CustomClient
+from lambo.message_pipeline import message_stage
+from lambo.models.emoji_usage_rollup_model import EmojiUsageDailyModel, RollupKey
 from lambo.models.used_emoji_model import UsedEmojiModel
 from lambo.utils import DateConverter
+from lambo.utils.emoji_index import EmojiIndex
+from lambo.utils.history_import import HistoryImporter
+from lambo.utils.write_buffer import WriteBehindBuffer
 
 _EPOCH = datetime.utcfromtimestamp(DISCORD_EPOCH / 1000)
+ROLLUP_BACKFILL_CHUNK = 5000
+HISTORY_BATCH_SIZE = 2000
+HISTORY_PROGRESS_INTERVAL = 15
 
 
-def get_guild_emojis_from_str(string: str, guild: discord.Guild) -> set[str]:
-    emojis = set()
-    for emoji in guild.emojis:
-        if str(emoji) in string:
-            emojis.add(emoji.name)
-    return emojis
+class EmojiUsage(typing.NamedTuple):
+    guild_id: int
+    emoji_id: int
+    emoji_name: str
+    used_by: int
+    timestamp: datetime
+
+    @property
+    def rollup_key(self) -> RollupKey:
+        return RollupKey(
+            self.guild_id, self.emoji_id, self.used_by, self.timestamp.date()
+        )
+
+
+def get_guild_emojis_from_str(
+    string: str, guild: discord.Guild, index: EmojiIndex
+) -> set[str]:
+    return {emoji.name for emoji in index.find(guild, string)}
 
 
-def parse_message(message: discord.Message) -> list[UsedEmojiModel]:
-    emojis = get_guild_emojis_from_str(message.content, message.guild)  # type: ignore
+def parse_message(message: discord.Message, index: EmojiIndex) -> list[EmojiUsage]:
+    guild: discord.Guild = message.guild  # type: ignore
+    emojis = index.find(guild, message.content)
     author_id: int = message.author.id  # type: ignore
     return [
+        EmojiUsage(guild.id, emoji.id, emoji.name, author_id, message.created_at)
+        for emoji in emojis
+    ]
+
+
+async def store_emoji_usages(usages: list[EmojiUsage]) -> None:
+    """
+    Inserts the raw usage rows and adds them to the daily rollup.
+    """
+    rows = [
         UsedEmojiModel(
-            emoji=emoji, used_by=str(author_id), timestamp=message.created_at
+            guild_id=usage.guild_id,
+            emoji_id=usage.emoji_id,
+            emoji=usage.emoji_name,
+            used_by=usage.used_by,
+            timestamp=usage.timestamp,
         )
-        for emoji in emojis
+        for usage in usages
     ]
+    counts = Counter(usage.rollup_key for usage in usages)
+    async with in_transaction():
+        await UsedEmojiModel.bulk_create(rows)
+        await EmojiUsageDailyModel.increment(counts)
 
 
 def get_timestamp_tag(timestamp: datetime) -> str:
@@ -46,23 +96,37 @@ class RankingFlags(FlagConverter):
     page: int = 1
 
 
+class HistoryFlags(FlagConverter):
+    all_channels: bool = flag(name="all", default=False)
+    restart: bool = flag(name="restart", default=False)
+    concurrency: int = flag(name="concurrency", aliases=["c"], default=4)
+
+
 class CountEmojiCog(Cog, name="Emoji Counting"):
+    FLUSH_SIZE = 500
+    FLUSH_DELAY = 10.0
+
     bot: CustomClient
+    emoji_buffer: WriteBehindBuffer[EmojiUsage]
 
     def __init__(self, bot: CustomClient):
         self.bot = bot
+        self.emoji_buffer = WriteBehindBuffer(
+            store_emoji_usages,
+            max_size=self.FLUSH_SIZE,
+            max_delay=self.FLUSH_DELAY,
+        )
+        self.bot.add_shutdown_hook(self.emoji_buffer.close)
 
-    @Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author.bot:
-            return
-        if message.guild is None:
-            return
-        prefixes = await self.bot.get_prefix(message)
-        if any(message.content.startswith(prefix) for prefix in prefixes):
-            return
-        parse = parse_message(message)
-        await UsedEmojiModel.bulk_create(parse)
+    def cog_unload(self) -> None:
+        self.bot.remove_shutdown_hook(self.emoji_buffer.close)
+        self.bot.run_in_background(self.emoji_buffer.close)
+
+    @message_stage(skip_commands=True)
+    async def count_emojis(self, message: discord.Message):
+        parse = parse_message(message, self.bot.emoji_index)
+        if parse:
+            self.emoji_buffer.extend(parse)
 
     @group(name="emojis")
     async def emojis(self, ctx: Context):
@@ -89,9 +153,8 @@ class CountEmojiCog(Cog, name="Emoji Counting"):
             if to_date is not None
             else datetime.now()
         )
-        emojis_count = await UsedEmojiModel.filter(
-            emoji=emoji.name, timestamp__gte=from_, timestamp__lte=to_
-        ).count()
+        await self.emoji_buffer.flush()
+        emojis_count = await self.count_usages(emoji, from_, to_)
         from_str = get_timestamp_tag(from_)
         to_str = get_timestamp_tag(to_)
         await ctx.send(
@@ -119,26 +182,30 @@ class CountEmojiCog(Cog, name="Emoji Counting"):
             if to_date is not None
             else datetime.now()
         )
+        await self.emoji_buffer.flush()
         # Get all users who used the emoji and their count
         users: list[dict[str, int]] = (
-            await UsedEmojiModel.annotate(count=Count("used_by"))
+            await EmojiUsageDailyModel.annotate(total=Sum("count"))
             .group_by("used_by")
-            .order_by("-count")
-            .filter(emoji=emoji.name, timestamp__gte=from_, timestamp__lte=to_)
+            .order_by("-total")
+            .filter(
+                guild_id=emoji.guild_id,
+                emoji_id=emoji.id,
+                day__gte=from_.date(),
+                day__lte=to_.date(),
+            )
             .limit(10)
-            .values("used_by", "count")  # type: ignore
+            .values("used_by", "total")  # type: ignore
         )
         # All usages during the time period
-        emojis_count = await UsedEmojiModel.filter(
-            emoji=emoji.name, timestamp__gte=from_, timestamp__lte=to_
-        ).count()
+        emojis_count = await self.count_usages(emoji, from_, to_)
         from_str = get_timestamp_tag(from_)
         to_str = get_timestamp_tag(to_)
 
         sb = f"{emoji} user usages from {from_str} to {to_str}."
         for user in users:
-            percentage = round(user["count"] / emojis_count * 100, 2)
-            sb += f"\n<@{user['used_by']}> used {user['count']} times ({percentage}%)."
+            percentage = round(user["total"] / emojis_count * 100, 2)
+            sb += f"\n<@{user['used_by']}> used {user['total']} times ({percentage}%)."
         await ctx.send(sb, allowed_mentions=discord.AllowedMentions(users=False))
 
     @emojis.command(name="rank", aliases=("r", "ranking"))
@@ -164,68 +231,188 @@ class CountEmojiCog(Cog, name="Emoji Counting"):
             else datetime.now()
         )
 
-        values: list[dict[str, int | str]] = (
-            await UsedEmojiModel.annotate(count=Count("id"))  # type: ignore
-            .filter(timestamp__gte=from_, timestamp__lte=to_)
+        guild: discord.Guild = ctx.guild  # type: ignore
+        assert isinstance(guild, discord.Guild)
+        await self.emoji_buffer.flush()
+        values: list[dict[str, int]] = (
+            await EmojiUsageDailyModel.annotate(total=Sum("count"))  # type: ignore
+            .filter(guild_id=guild.id, day__gte=from_.date(), day__lte=to_.date())
             .offset((flags.page - 1) * 10)
             .limit(10)
-            .group_by("emoji")
-            .order_by("count" if flags.reversed else "-count")
-            .values("emoji", "count")
+            .group_by("emoji_id")
+            .order_by("total" if flags.reversed else "-total")
+            .values("emoji_id", "total")
         )
 
         from_str = get_timestamp_tag(from_)
         to_str = get_timestamp_tag(to_)
         content = f"Ranking from {from_str} to {to_str}\n"
-        guild: discord.Guild = ctx.guild  # type: ignore
-        assert isinstance(guild, discord.Guild)
         for g in values:
-            guild_emojis: tuple[discord.Emoji, ...] = guild.emojis
-            emojis: list[discord.Emoji] = [
-                e for e in guild_emojis if e.name == g["emoji"]
-            ]
-            if len(emojis) == 0:
+            emoji = self.bot.emoji_index.get(guild, g["emoji_id"])
+            if emoji is None:
                 continue
-            emoji: discord.Emoji = emojis[0]
-            content += f"{emoji} was used {g['count']} times.\n"
+            content += f"{emoji} was used {g['total']} times.\n"
         await ctx.send(content)
 
+    @staticmethod
+    async def count_usages(emoji: discord.Emoji, from_: datetime, to_: datetime) -> int:
+        totals: list[int] = (
+            await EmojiUsageDailyModel.annotate(total=Sum("count"))  # type: ignore
+            .filter(
+                guild_id=emoji.guild_id,
+                emoji_id=emoji.id,
+                day__gte=from_.date(),
+                day__lte=to_.date(),
+            )
+            .group_by("emoji_id")
+            .values_list("total", flat=True)
+        )
+        return sum(totals)
+
+    @is_owner()
+    @emojis.command(name="buffer", hidden=True)
+    async def buffer_stats(self, ctx: Context):
+        stats = self.emoji_buffer.stats
+        await ctx.send(
+            f"Queued: {self.emoji_buffer.depth} (max {stats.max_depth})\n"
+            f"Flushes: {stats.flushes} ({stats.failed_flushes} failed), "
+            f"{stats.flushed_items} rows\n"
+            f"Flush latency: last {stats.last_flush_seconds * 1000:.1f}ms, "
+            f"avg {stats.average_flush_seconds * 1000:.1f}ms, "
+            f"max {stats.max_flush_seconds * 1000:.1f}ms"
+        )
+
+    @staticmethod
+    async def assign_legacy_ids(guild: discord.Guild) -> int:
+        """
+        Assigns usage rows that only have an emoji name to the emojis of
+        `guild` with that name. Emoji names were not scoped to a guild, so
+        this only makes sense for the guild the rows came from.
+        """
+        assigned = 0
+        for emoji in guild.emojis:
+            assigned += await UsedEmojiModel.filter(
+                emoji_id=None, emoji=emoji.name
+            ).update(guild_id=guild.id, emoji_id=emoji.id)
+        return assigned
+
+    @is_owner()
+    @emojis.command(name="backfill-rollup", hidden=True)
+    async def backfill_rollup(self, ctx: Context):
+        """
+        Assigns legacy usage rows to this guild's emojis by name, then
+        rebuilds the guild's daily usage rollup from the raw usage rows.
+        """
+        guild: discord.Guild = ctx.guild  # type: ignore
+        assert isinstance(guild, discord.Guild)
+        await self.emoji_buffer.flush()
+        async with in_transaction():
+            assigned = await self.assign_legacy_ids(guild)
+            # Rows after `last_id` are already counted by the live insert path.
+            last_row = await UsedEmojiModel.all().order_by("-id").first()
+            await EmojiUsageDailyModel.filter(guild_id=guild.id).delete()
+        if last_row is None:
+            await ctx.send("Nothing to backfill.")
+            return
+        last_id: int = last_row.id
+        await ctx.send(f"Assigned {assigned} legacy usages. Backfilling rollup...")
+        cursor = 0
+        processed = 0
+        async with ctx.typing():
+            while cursor < last_id:
+                rows: list[tuple[int, int, int, datetime]] = (
+                    await UsedEmojiModel.filter(
+                        guild_id=guild.id, id__gt=cursor, id__lte=last_id
+                    )
+                    .order_by("id")
+                    .limit(ROLLUP_BACKFILL_CHUNK)
+                    .values_list("id", "emoji_id", "used_by", "timestamp")
+                )  # type: ignore
+                if not rows:
+                    break
+                counts: Counter[RollupKey] = Counter(
+                    RollupKey(guild.id, emoji_id, used_by, timestamp.date())
+                    for _, emoji_id, used_by, timestamp in rows
+                )
+                async with in_transaction():
+                    await EmojiUsageDailyModel.increment(counts)
+                cursor = rows[-1][0]
+                processed += len(rows)
+        await ctx.send(f"Done. {processed} usages processed.")
+
     @is_owner()
     @emojis.command(name="load-history", hidden=True)
     async def load_history(
-        self, ctx: Context, limit: int, before: typing.Optional[discord.Message] = None
+        self,
+        ctx: Context,
+        channels: Greedy[discord.TextChannel],
+        *,
+        flags: HistoryFlags,
     ):
-        before_message: discord.Message = before if before is not None else ctx.message  # type: ignore
-        limit = min(limit, 10000)
-        await ctx.send("Loading history...")
-        i = 0
-        last = before_message
-        async with ctx.typing():
-            channel: discord.TextChannel = ctx.channel  # type: ignore
-            async for message in channel.history(limit=limit, before=before_message):
-                if message.author.bot:  # type: ignore
-                    continue
-                prefix = await self.bot.get_prefix(message)
-                if isinstance(prefix, str):
-                    if message.content.startswith(prefix):
-                        continue
-                elif isinstance(prefix, list):
-                    starts_with_prefix = False
-                    for p in prefix:
-                        if message.content.startswith(p):
-                            starts_with_prefix = True
-                            break
-                    if starts_with_prefix:
-                        continue
-                parse = parse_message(message)
-                last = message
-                await UsedEmojiModel.bulk_create(parse)
-                i += 1
-                if i % 10 == 0:
-                    print(f"{i} messages processed.")
-
-        print(f"{i} messages processed.", flush=True)
-        await ctx.send(f"Done. Last message: {last.jump_url}")
+        """
+        Imports emoji usage from channel history. Interrupted imports resume
+        from their last stored batch, use `restart: true` to start over.
+        """
+        guild: discord.Guild = ctx.guild  # type: ignore
+        assert isinstance(guild, discord.Guild)
+        if flags.all_channels:
+            channels = guild.text_channels  # type: ignore
+        elif not channels:
+            channels = [ctx.channel]  # type: ignore
+        if flags.restart:
+            await HistoryImporter.reset(channel.id for channel in channels)
+
+        prefixes = await self.bot.get_prefix(ctx.message)
+        if isinstance(prefixes, str):
+            prefixes = [prefixes]
+        prefix_tuple = tuple(prefixes)
+
+        async def handle_batch(messages: list[discord.Message]) -> None:
+            usages = [
+                usage
+                for message in messages
+                if not message.author.bot
+                and not message.content.startswith(prefix_tuple)
+                for usage in parse_message(message, self.bot.emoji_index)
+            ]
+            if usages:
+                await store_emoji_usages(usages)
+
+        importer = HistoryImporter(
+            channels,
+            handle_batch,
+            concurrency=flags.concurrency,
+            batch_size=HISTORY_BATCH_SIZE,
+            before=ctx.message,
+        )
+        status = await ctx.send(f"Loading history of {len(channels)} channels...")
+
+        async def report_progress() -> None:
+            while True:
+                await asyncio.sleep(HISTORY_PROGRESS_INTERVAL)
+                await status.edit(
+                    content=f"Loading history... {importer.processed} messages, "
+                    f"{importer.finished}/{len(channels)} channels finished."
+                )
+
+        reporter = asyncio.create_task(report_progress())
+        try:
+            await importer.run()
+        finally:
+            reporter.cancel()
+
+        failed = [
+            f"{progress.channel.mention}: {progress.error}"
+            for progress in importer.progress.values()
+            if progress.error is not None
+        ]
+        content = (
+            f"Done. {importer.processed} messages processed "
+            f"in {len(channels)} channels."
+        )
+        if failed:
+            content += "\nFailed:\n" + "\n".join(failed)
+        await status.edit(content=content)
 
 
 def setup(bot: CustomClient):
@@ -0,0 +1,185 @@
+import asyncio
+import io
+import time
+import typing
+
+import discord
+from discord.ext.commands import Cog, Context, group, is_owner
+
+from lambo import CustomClient
+from lambo.utils import codized
+from lambo.utils.metrics import MetricsServer
+from lambo.utils.profiler import ProfileSession
+
+SORT_KEYS: dict[str, typing.Callable[[typing.Any], float]] = {
+    "total": lambda metrics: metrics.duration.sum,
+    "p99": lambda metrics: metrics.duration.quantile(0.99),
+    "count": lambda metrics: metrics.duration.count,
+    "errors": lambda metrics: metrics.errors,
+    "queries": lambda metrics: metrics.queries.sum,
+}
+
+
+class DiagnosticsCog(Cog, name="Diagnostics"):
+    bot: CustomClient
+    server: typing.Optional[MetricsServer]
+    profile_session: typing.Optional[ProfileSession]
+    profile_task: typing.Optional[asyncio.Task]
+
+    def __init__(self, bot: CustomClient) -> None:
+        self.bot = bot
+        self.server = None
+        self.profile_session = None
+        self.profile_task = None
+        settings = bot._settings
+        if settings.metrics_port is not None:
+            self.server = MetricsServer(
+                bot.metrics, settings.metrics_host, settings.metrics_port
+            )
+            self.bot.add_shutdown_hook(self.server.close)
+            self.bot.loop.create_task(self.server.start())
+
+    def cog_unload(self) -> None:
+        if self.server is not None:
+            self.bot.remove_shutdown_hook(self.server.close)
+            self.bot.run_in_background(self.server.close)
+        if self.profile_task is not None:
+            self.profile_task.cancel()
+        if self.profile_session is not None:
+            self.profile_session.stop()
+            self.profile_session = None
+
+    @is_owner()
+    @group(name="stats", invoke_without_command=True)
+    async def stats(self, ctx: Context, sort: str = "total", limit: int = 15):
+        """
+        Slowest listeners and commands since startup. Sort by total, p99,
+        count, errors or queries.
+        """
+        if sort not in SORT_KEYS:
+            await ctx.reply(f"Sort by one of: {', '.join(SORT_KEYS)}.")
+            return
+        handlers = sorted(
+            self.bot.metrics.handlers.items(),
+            key=lambda item: SORT_KEYS[sort](item[1]),
+            reverse=True,
+        )[:limit]
+        if not handlers:
+            await ctx.reply("Nothing recorded yet.")
+            return
+        lines = [
+            f"{'handler':<40} {'runs':>7} {'p50 ms':>8} {'p99 ms':>8} "
+            f"{'total s':>8} {'err':>5} {'q/run':>6}"
+        ]
+        for (kind, name), metrics in handlers:
+            duration = metrics.duration
+            label = f"{kind[0]}:{name}"
+            if len(label) > 40:
+                label = label[:39] + "…"
+            lines.append(
+                f"{label:<40} {duration.count:>7} "
+                f"{duration.quantile(0.5) * 1000:>8.1f} "
+                f"{duration.quantile(0.99) * 1000:>8.1f} "
+                f"{duration.sum:>8.1f} {metrics.errors:>5} "
+                f"{metrics.queries.average:>6.1f}"
+            )
+        await ctx.send(codized("\n".join(lines)))
+
+    @is_owner()
+    @stats.command(name="reset")
+    async def stats_reset(self, ctx: Context):
+        self.bot.metrics.reset()
+        await ctx.reply("Metrics reset.")
+
+    @is_owner()
+    @group(name="profile", invoke_without_command=True)
+    async def profile(self, ctx: Context):
+        """
+        Samples the event loop and records slow callbacks, see `profile start`.
+        """
+        if self.profile_session is None:
+            await ctx.reply("Not profiling.")
+        else:
+            elapsed = time.monotonic() - self.profile_session.started_at
+            await ctx.reply(f"Profiling for {elapsed:.0f}s.")
+
+    @is_owner()
+    @profile.command(name="start")
+    async def profile_start(
+        self,
+        ctx: Context,
+        seconds: float = 30,
+        threshold_ms: float = 100,
+        interval_ms: float = 5,
+    ):
+        """
+        Samples the event loop thread every `interval_ms` for `seconds` and
+        records callbacks that block the loop longer than `threshold_ms`, then
+        uploads the collapsed stacks, for flamegraph.pl or speedscope.
+        """
+        if self.profile_session is not None:
+            await ctx.reply("Already profiling, use `profile stop` first.")
+            return
+        if not 0 < seconds <= 600 or interval_ms < 1 or threshold_ms <= 0:
+            await ctx.reply(
+                "Profile for up to 600 seconds, sampling at most every millisecond."
+            )
+            return
+        self.profile_session = ProfileSession(interval_ms / 1000, threshold_ms / 1000)
+        self.profile_session.start()
+        self.profile_task = asyncio.create_task(self.stop_profile_after(ctx, seconds))
+        await ctx.reply(f"Profiling for {seconds:g}s.")
+
+    @is_owner()
+    @profile.command(name="stop")
+    async def profile_stop(self, ctx: Context):
+        if self.profile_session is None:
+            await ctx.reply("Not profiling.")
+            return
+        if self.profile_task is not None:
+            self.profile_task.cancel()
+        await self.send_profile(ctx)
+
+    async def stop_profile_after(self, ctx: Context, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+        self.profile_task = None
+        await self.send_profile(ctx)
+
+    async def send_profile(self, ctx: Context) -> None:
+        session = self.profile_session
+        if session is None:
+            return
+        session.stop()
+        self.profile_session = None
+        self.profile_task = None
+
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        files = [
+            discord.File(
+                io.BytesIO(session.sampler.collapsed().encode()),
+                filename=f"profile-{stamp}.folded",
+            )
+        ]
+        slow_callbacks = session.slow_callbacks.entries
+        if slow_callbacks:
+            files.append(
+                discord.File(
+                    io.BytesIO("\n".join(slow_callbacks).encode()),
+                    filename=f"slow-callbacks-{stamp}.txt",
+                )
+            )
+        total = session.sample_count or 1
+        lines = [
+            f"{session.sample_count} samples in {session.duration:.1f}s, "
+            f"{len(slow_callbacks)} slow callbacks.",
+            "",
+        ]
+        for label, count in session.top_functions(10):
+            if len(label) > 80:
+                label = "…" + label[-79:]
+            lines.append(f"{count / total:>6.1%} {label}")
+        await ctx.send(codized("\n".join(lines)), files=files)
+
+
+def setup(bot: CustomClient):
+    bot.add_cog(DiagnosticsCog(bot))
@@ -1,40 +1,173 @@
 import asyncio
-from datetime import datetime, timedelta
-from random import sample
-from typing import Optional, Tuple, Union, overload
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import ClassVar, Optional, Tuple, Union, overload
 
 import discord
 from discord.embeds import EmptyEmbed
 from discord.ext.commands import Cog, Context, command
-from discord.ext.tasks import loop
 from discord.utils import format_dt
 
 from lambo import CustomClient
 from lambo.models.giveway_model import GiveawayModel
-from lambo.utils import TimedeltaConverter, get_text_channel
+from lambo.utils import TimedeltaConverter, get_text_channel, reservoir_sample
 
+logger = logging.getLogger(__name__)
+
+
+def giveaway_deadline(giveaway: GiveawayModel) -> float:
+    ends_at: datetime = giveaway.ends_at  # type: ignore
+    if ends_at.tzinfo is None:
+        # Giveaways are created with naive UTC datetimes.
+        ends_at = ends_at.replace(tzinfo=timezone.utc)
+    return ends_at.timestamp()
+
+
+class GiveawayScheduler:
+    """
+    Keeps running giveaways in a min-heap keyed by their end time and
+    sleeps until the earliest one is due. Scheduling a giveaway that ends
+    sooner wakes it up early.
+
+    Giveaways that fail to end are retried with exponential backoff, up to
+    `MAX_RETRY_DELAY` seconds apart, and given up on after `MAX_ATTEMPTS`.
+    Errors in the loop itself are logged and retried after `ERROR_DELAY`
+    seconds.
+    """
+
+    MAX_ATTEMPTS: ClassVar[int] = 8
+    RETRY_DELAY: ClassVar[float] = 30
+    MAX_RETRY_DELAY: ClassVar[float] = 3600
+    ERROR_DELAY: ClassVar[float] = 30
 
-class GiveawayCog(Cog, name="Template"):
     bot: CustomClient
+    _heap: list[tuple[float, int]]
+    _pending: dict[int, GiveawayModel]
+    _attempts: dict[int, int]
+    # Ended giveaways whose `ended` flag is not stored yet.
+    _unsaved: list[GiveawayModel]
 
     def __init__(self, bot: CustomClient) -> None:
         self.bot = bot
-        self.check_giveaway.start()
+        self._heap = []
+        self._pending = {}
+        self._attempts = {}
+        self._unsaved = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
 
-    def cog_unload(self) -> None:
-        self.check_giveaway.cancel()
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def start(self) -> None:
+        self._task = self.bot.loop.create_task(self._run())
 
-    @loop(seconds=5.0)
-    async def check_giveaway(self):
-        ended_giveaways = await GiveawayModel.filter(
-            ends_at__lt=datetime.utcnow(), ended=False
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def schedule(self, giveaway: GiveawayModel, at: Optional[float] = None) -> None:
+        if at is None:
+            at = giveaway_deadline(giveaway)
+        self._pending[giveaway.pk] = giveaway
+        heapq.heappush(self._heap, (at, giveaway.pk))
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        await self.bot.wait_until_ready()
+        while True:
+            try:
+                for giveaway in await GiveawayModel.filter(ended=False):
+                    self.schedule(giveaway)
+                break
+            except Exception:
+                logger.exception("Loading running giveaways failed")
+                await asyncio.sleep(self.ERROR_DELAY)
+        while True:
+            try:
+                await self._run_once()
+            except Exception:
+                logger.exception("Giveaway scheduler failed")
+                await asyncio.sleep(self.ERROR_DELAY)
+
+    async def _run_once(self) -> None:
+        if self._unsaved:
+            await GiveawayModel.bulk_update(self._unsaved, ["ended"])
+            self._unsaved = []
+        self._wakeup.clear()
+        now = time.time()
+        due: list[GiveawayModel] = []
+        while self._heap and self._heap[0][0] <= now:
+            _, pk = heapq.heappop(self._heap)
+            giveaway = self._pending.pop(pk, None)
+            if giveaway is not None:
+                due.append(giveaway)
+        if due:
+            await self._end(due)
+            return
+        timeout = self._heap[0][0] - now if self._heap else None
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _end(self, giveaways: list[GiveawayModel]) -> None:
+        results = await asyncio.gather(
+            *[GiveawayCog.end_giveaway(self.bot, giveaway) for giveaway in giveaways],
+            return_exceptions=True,
         )
-        end_actions = [
-            self.end_giveaway(self.bot, giveaway) for giveaway in ended_giveaways
-        ]
-        results = await asyncio.gather(*end_actions)
-        if results:
-            await GiveawayModel.bulk_update(results, ["ended"])
+        for giveaway, result in zip(giveaways, results):
+            if isinstance(result, BaseException):
+                attempts = self._attempts.get(giveaway.pk, 0) + 1
+                if attempts >= self.MAX_ATTEMPTS:
+                    logger.error(
+                        "Ending giveaway %s failed %s times, giving up",
+                        giveaway.pk,
+                        attempts,
+                        exc_info=result,
+                    )
+                    self._attempts.pop(giveaway.pk, None)
+                    # Stored as ended so a restart doesn't pick it up again.
+                    giveaway.ended = True  # type: ignore
+                    self._unsaved.append(giveaway)
+                    continue
+                self._attempts[giveaway.pk] = attempts
+                delay = min(
+                    self.RETRY_DELAY * 2 ** (attempts - 1), self.MAX_RETRY_DELAY
+                )
+                logger.error(
+                    "Ending giveaway %s failed, retrying in %ss",
+                    giveaway.pk,
+                    delay,
+                    exc_info=result,
+                )
+                giveaway.ended = False  # type: ignore
+                self.schedule(giveaway, time.time() + delay)
+            else:
+                self._attempts.pop(giveaway.pk, None)
+                self._unsaved.append(giveaway)
+        if self._unsaved:
+            await GiveawayModel.bulk_update(self._unsaved, ["ended"])
+            self._unsaved = []
+
+
+class GiveawayCog(Cog, name="Template"):
+    scheduler: ClassVar[Optional[GiveawayScheduler]] = None
+
+    bot: CustomClient
+
+    def __init__(self, bot: CustomClient) -> None:
+        self.bot = bot
+        GiveawayCog.scheduler = GiveawayScheduler(bot)
+        GiveawayCog.scheduler.start()
+
+    def cog_unload(self) -> None:
+        if GiveawayCog.scheduler is not None:
+            GiveawayCog.scheduler.stop()
+            GiveawayCog.scheduler = None
 
     @staticmethod
     def giveaway_embed(
@@ -98,6 +231,8 @@ class GiveawayCog(Cog, name="Template"):
         embed = GiveawayCog.giveaway_embed(giveaway, author)
         await msg.edit(embed=embed)
         await msg.add_reaction("🎉")
+        if GiveawayCog.scheduler is not None:
+            GiveawayCog.scheduler.schedule(giveaway)
         return (giveaway, msg)
 
     @staticmethod
@@ -108,24 +243,18 @@ class GiveawayCog(Cog, name="Template"):
         if not reaction:
             return None
 
-        reacted_users = await reaction[0].users().flatten()
-        reacted_members = [
-            user
-            for user in reacted_users
-            if not user.bot and isinstance(user, discord.Member)
-        ]
-
-        winner_count = min(giveaway.winners, len(reacted_members))
-        if winner_count == 0:
-            return []
-
-        return sample(reacted_members, winner_count)
+        # Users are fetched page by page, only the winners are kept around.
+        return await reservoir_sample(
+            reaction[0].users(),
+            giveaway.winners,
+            lambda user: not user.bot and isinstance(user, discord.Member),
+        )
 
     @staticmethod
     async def end_giveaway(bot: CustomClient, giveaway: GiveawayModel) -> GiveawayModel:
         giveaway.ended = True  # type: ignore
-        channel_id = int(giveaway.channel_id)
-        message_id = int(giveaway.message_id)
+        channel_id = giveaway.channel_id
+        message_id = giveaway.message_id
         try:
             channel = get_text_channel(bot, channel_id)
             message = await channel.fetch_message(message_id)
@@ -135,21 +264,36 @@ class GiveawayCog(Cog, name="Template"):
         winners = await GiveawayCog.get_giveaway_winners(message, giveaway)
         if not winners:
             await message.reply(content="No one won the giveaway")
+            await GiveawayCog.store_ended(giveaway)
             return giveaway
         winners_mentions = ", ".join(winner.mention for winner in winners)
         await message.reply(
             f"{winners_mentions} won the giveaway!",
             allowed_mentions=discord.AllowedMentions(users=True),
         )
+        # The winners are announced, nothing after this may raise or the
+        # scheduler would draw and announce them again.
+        await GiveawayCog.store_ended(giveaway)
 
-        await message.edit(
-            embed=message.embeds[0].set_field_at(
-                2, name="Winners", value=winners_mentions, inline=False
+        try:
+            await message.edit(
+                embed=message.embeds[0].set_field_at(
+                    2, name="Winners", value=winners_mentions, inline=False
+                )
             )
-        )
+        except Exception:
+            logger.exception("Updating the embed of giveaway %s failed", giveaway.pk)
 
         return giveaway
 
+    @staticmethod
+    async def store_ended(giveaway: GiveawayModel) -> None:
+        try:
+            await giveaway.save(update_fields=("ended",))
+        except Exception:
+            # The scheduler stores it again with the other ended giveaways.
+            logger.exception("Storing the end of giveaway %s failed", giveaway.pk)
+
     @command(name="giveaway", aliases=("gstart",))
     async def giveaway_cmd(
         self,
@@ -187,11 +331,11 @@ class GiveawayCog(Cog, name="Template"):
         if not giveaway.ended:
             await ctx.reply("This giveaway is still running")
             return
-        channel = self.bot.get_channel(int(giveaway.channel_id))
+        channel = self.bot.get_channel(giveaway.channel_id)
         if channel is None:
             await ctx.reply("Channel not found")
             return
-        message = await channel.fetch_message(int(giveaway.message_id))  # type: ignore
+        message = await channel.fetch_message(giveaway.message_id)  # type: ignore
         if message is None:
             await ctx.reply("Message not found")
             return
@@ -224,11 +368,11 @@ class GiveawayCog(Cog, name="Template"):
         if not giveaway.ended:
             await ctx.reply("This giveaway is still running")
             return
-        channel = self.bot.get_channel(int(giveaway.channel_id))
+        channel = self.bot.get_channel(giveaway.channel_id)
         if channel is None:
             await ctx.reply("Channel not found")
             return
-        message = await channel.fetch_message(int(giveaway.message_id))  # type: ignore
+        message = await channel.fetch_message(giveaway.message_id)  # type: ignore
         if message is None:
             await ctx.reply("Message not found")
             return
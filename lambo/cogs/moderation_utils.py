@@ -3,10 +3,21 @@ import typing
 from io import StringIO
 
 import discord
-from discord.ext.commands import Cog, Context, FlagConverter, group, has_permissions
+from discord.ext.commands import (
+    Cog,
+    Context,
+    FlagConverter,
+    Greedy,
+    group,
+    has_permissions,
+)
 
 from lambo import CustomClient
-from lambo.utils import FuzzyRoleConverter, is_member
+from lambo.utils import FuzzyRoleConverter, is_member, unwrap_channels
+from lambo.utils.bulk import BulkMemberExecutor
+
+BULK_PROGRESS_INTERVAL = 10
+CHANNEL_EDIT_CONCURRENCY = 5
 
 
 class PermissionsFor(FlagConverter):
@@ -33,7 +44,8 @@ class ModerationUtilsCog(Cog, name="Moderation Utilities"):
     ):
         first_role: discord.Role = first_role_  # type: ignore
         second_role: discord.Role = second_role_  # type: ignore
-        members_overlap = set(first_role.members) & set(second_role.members)
+        index = self.bot.role_index
+        members_overlap = index.member_ids(first_role) & index.member_ids(second_role)
         await ctx.reply(f"There are {len(members_overlap)} members in both roles.")
 
     @role.command(name="id")
@@ -74,37 +86,96 @@ class ModerationUtilsCog(Cog, name="Moderation Utilities"):
         """
         if from_role == to_role:
             await ctx.reply("Cannot fuse a role with itself")
+            return
         assert is_member(ctx.author)
+        index = self.bot.role_index
+        from_ids = index.member_ids(from_role)
+        to_ids = index.member_ids(to_role)
         if (
-            len(from_role.members) > 100
-            and len(to_role.members) > 100
+            len(from_ids) > 100
+            and len(to_ids) > 100
             and not await self.bot.is_owner(ctx.author)  # type: ignore
         ):
             await ctx.reply(
                 "Cannot fuse more than 100 members unless you're the bot owner"
             )
             return
+        reason = f"Fusing {from_role.name} and {to_role.name}"
+
+        async def add_role(member: discord.Member) -> None:
+            await member.add_roles(to_role, reason=reason)
+
+        executor = BulkMemberExecutor(
+            f"fuse:{from_role.guild.id}:{from_role.id}:{to_role.id}",
+            from_role.guild,
+            from_ids - to_ids,
+            add_role,
+        )
         msg = await ctx.reply(f"Fusing {from_role.name} and {to_role.name}")
-        async with ctx.typing():
-            members: StringIO = StringIO()
-            coros: list[typing.Awaitable] = []
-            for member in from_role.members:
-                if member in to_role.members:
-                    continue
-                members.write(f"{member} ({member.id})\n")
-                coros.append(
-                    member.add_roles(
-                        to_role,
-                        reason=f"Fusing {from_role.name} and {to_role.name}",
-                    )
-                )
-            await msg.edit(
-                content="Fetched all members from role2. Waiting for them to be added to role1"
+        await self.run_bulk(msg, executor, "Fusing", "fused")
+
+    @role.command(name="strip")
+    @has_permissions(manage_roles=True)
+    async def strip_role(self, ctx: Context, role: discord.Role):
+        """
+        Remove a role from everyone who has it
+        """
+        assert is_member(ctx.author)
+        if role.is_default() or role.managed:
+            await ctx.reply(f"{role.name} cannot be removed from members")
+            return
+        if role >= ctx.author.top_role and ctx.author.id != role.guild.owner_id:
+            await ctx.reply(
+                f"{role.name} is not below your highest role, you cannot strip it"
+            )
+            return
+        member_ids = self.bot.role_index.member_ids(role)
+        if len(member_ids) > 100 and not await self.bot.is_owner(ctx.author):  # type: ignore
+            await ctx.reply(
+                "Cannot strip a role from more than 100 members unless you're the bot owner"
             )
-            await asyncio.gather(*coros)
-            await msg.edit(content=f"Fused {from_role.name} and {to_role.name}")
-            members.seek(0)
-            await msg.reply(file=discord.File(members, filename="members_fused.txt"))  # type: ignore
+            return
+        reason = f"Stripping {role.name} by {ctx.author}"
+
+        async def remove_role(member: discord.Member) -> None:
+            await member.remove_roles(role, reason=reason)
+
+        executor = BulkMemberExecutor(
+            f"strip:{role.guild.id}:{role.id}", role.guild, member_ids, remove_role
+        )
+        msg = await ctx.reply(f"Removing {role.name} from {len(member_ids)} members")
+        await self.run_bulk(msg, executor, f"Stripping {role.name}", "stripped")
+
+    async def run_bulk(
+        self,
+        msg: discord.Message,
+        executor: BulkMemberExecutor,
+        action: str,
+        done: str,
+    ) -> None:
+        """
+        Runs `executor` with progress edits to `msg`, then replies with the
+        processed members and the ones that failed.
+        """
+
+        async def report_progress(executor: BulkMemberExecutor) -> None:
+            await msg.edit(content=f"{action}... {executor.summary()}")
+
+        # A resumed run narrows `executor.member_ids` to the members after
+        # its checkpoint, the list covers the whole job.
+        member_ids = executor.member_ids
+        await executor.run(report_progress, BULK_PROGRESS_INTERVAL)
+        await msg.edit(content=f"Done, {done} {executor.summary()}.")
+        members = StringIO()
+        for member in self.bot.role_index.members(executor.guild, member_ids):
+            if member.id not in executor.failures:
+                members.write(f"{member} ({member.id})\n")
+        members.seek(0)
+        files = [discord.File(members, filename=f"members_{done}.txt")]  # type: ignore
+        if executor.failures:
+            report = StringIO(executor.failure_report())
+            files.append(discord.File(report, filename="members_failed.txt"))  # type: ignore
+        await msg.reply(files=files)
 
     @group(name="channel", aliaess=["ch"], invoke_without_command=False)
     async def channel(self, ctx: Context):
@@ -140,62 +211,87 @@ class ModerationUtilsCog(Cog, name="Moderation Utilities"):
         self,
         ctx: Context,
         channel: discord.abc.GuildChannel,
-        member: discord.Member,
+        _members: Greedy[discord.Member],
         *,
         permissions: PermissionsFor,
     ):
+        """
+        Set permissions for one or more members in a channel, or in a
+        category and every channel in it
+        """
         assert is_member(ctx.author)
+        members: list[discord.Member] = list(dict.fromkeys(_members))  # type: ignore
+        if not members:
+            await ctx.reply("Mention at least one member.")
+            return
         if not channel.permissions_for(ctx.author).manage_permissions:
             await ctx.send(
                 "You do not have permission to manage permissions for this channel."
             )
             return
-        await ctx.send(
-            f"Adding permissions for {member.name} in {channel}. It might take a while..."
+        channels = [channel]
+        if isinstance(channel, discord.CategoryChannel):
+            channels.extend(unwrap_channels(channel))
+        names = ", ".join(member.name for member in members)
+        msg = await ctx.send(
+            f"Adding permissions for {names} in {len(channels)} channels..."
         )
-        ctx.typing()
-        permissions_set_for: set[str] = set()
-        permissions_lacking_for: set[str] = set()
-        if not self.check_bot_perms_for_channel(
-            ctx, channel, discord.Permissions.manage_permissions
-        ):
-            permissions_lacking_for.add(channel.mention)
-        else:
-            overwrites: discord.PermissionOverwrite = channel.overwrites_for(
-                member  # type: ignore
-            )
+
+        async def apply(
+            target: discord.abc.GuildChannel, member: discord.Member
+        ) -> None:
+            # One overwrite per request, editing the channel's whole list
+            # would drop the overwrites of members that aren't cached.
+            overwrites = target.overwrites_for(member)  # type: ignore
             self.set_channel_overwrites(overwrites, permissions)
-            try:
-                await channel.set_permissions(member, overwrite=overwrites)
-                permissions_set_for.add(channel.mention)
-            except Exception as e:
-                await ctx.send(
-                    f"Failed to set permissions for {member.name} in {channel} : {e}"
-                )
-                permissions_lacking_for.add(channel.mention)
-        if isinstance(channel, discord.CategoryChannel):
-            for subchannel in channel.channels:
-                if not self.check_bot_perms_for_channel(
-                    ctx, channel, discord.Permissions.manage_permissions
-                ):
-                    permissions_lacking_for.add(subchannel.mention)
-                    continue
-                overwrites = subchannel.overwrites_for(member)  # type: ignore
-                self.set_channel_overwrites(overwrites, permissions)
+            await target.set_permissions(member, overwrite=overwrites)
+
+        semaphore = asyncio.Semaphore(CHANNEL_EDIT_CONCURRENCY)
+        failed: dict[discord.abc.GuildChannel, str] = {}
+
+        async def apply_bounded(
+            target: discord.abc.GuildChannel, member: discord.Member
+        ) -> None:
+            async with semaphore:
                 try:
-                    await subchannel.set_permissions(member, overwrite=overwrites)
-                    permissions_set_for.add(subchannel.mention)
-                except Exception as e:
-                    await ctx.send(
-                        f"Failed to set permissions for {member.name} in {subchannel.name} : {e}"
-                    )
-                    permissions_lacking_for.add(subchannel.mention)
-
-        await ctx.reply(
-            f"Set permissions for {member.name} in {', '.join(permissions_set_for)}\n"
-            f"Couldn't set permissions for {', '.join(permissions_lacking_for)}"
+                    await apply(target, member)
+                except discord.HTTPException as e:
+                    failed.setdefault(target, str(e))
+
+        for target in channels:
+            if not self.check_bot_perms_for_channel(
+                ctx, target, discord.Permissions.manage_permissions
+            ):
+                failed[target] = "Missing permissions"
+        await asyncio.gather(
+            *(
+                apply_bounded(target, member)
+                for target in channels
+                if target not in failed
+                for member in members
+            )
         )
 
+        succeeded = [target.mention for target in channels if target not in failed]
+        content = f"Set permissions for {names} in {len(succeeded)} channels"
+        if succeeded:
+            content += f": {', '.join(succeeded)}"
+        if failed:
+            content += f"\nCouldn't set permissions in {len(failed)} channels:\n"
+            content += "\n".join(
+                f"{target.mention}: {error}" for target, error in failed.items()
+            )
+        if len(content) > 2000:
+            await msg.edit(
+                content=f"Set permissions for {names} in {len(succeeded)} "
+                f"channels, couldn't in {len(failed)}."
+            )
+            await msg.reply(
+                file=discord.File(StringIO(content), filename="permissions.txt")  # type: ignore
+            )
+        else:
+            await msg.edit(content=content)
+
 
 def setup(bot: CustomClient):
     bot.add_cog(ModerationUtilsCog(bot))
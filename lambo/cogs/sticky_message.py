@@ -1,3 +1,6 @@
+import asyncio
+import logging
+import time
 import typing
 
 import discord
@@ -6,14 +9,52 @@ from discord.ext.commands import Cog, Context, command, group, is_owner
 from discord.utils import escape_markdown
 
 from lambo import CustomClient
+from lambo.message_pipeline import message_stage
 from lambo.models import StickyMessageModel
 
+logger = logging.getLogger(__name__)
+
 
 class StickyMessageCog(Cog, name="Sticky Message"):
+    # Repost once the channel has been quiet for this many seconds...
+    REPOST_QUIET_PERIOD = 3.0
+    # ...but never later than this many seconds after the first new message.
+    REPOST_MAX_DELAY = 15.0
+
     bot: CustomClient
+    stickies: dict[int, StickyMessageModel]
+    _reposts: dict[int, asyncio.Task]
+    _pending_since: dict[int, float]
+    _locks: dict[int, asyncio.Lock]
 
     def __init__(self, bot: CustomClient) -> None:
         self.bot = bot
+        self.stickies = {}
+        self._reposts = {}
+        self._pending_since = {}
+        self._locks = {}
+        self._load_task = self.bot.loop.create_task(self.load_stickies())
+
+    def cog_unload(self) -> None:
+        self._load_task.cancel()
+        for task in self._reposts.values():
+            task.cancel()
+        self._reposts.clear()
+
+    async def load_stickies(self) -> None:
+        # Updated in place, the message pipeline holds a reference to it.
+        self.stickies.update(
+            {msg.channel_id: msg for msg in await StickyMessageModel.all()}
+        )
+
+    def _cancel_repost(self, channel_id: int) -> None:
+        task = self._reposts.pop(channel_id, None)
+        if task is not None:
+            task.cancel()
+        self._pending_since.pop(channel_id, None)
+
+    def _lock(self, channel_id: int) -> asyncio.Lock:
+        return self._locks.setdefault(channel_id, asyncio.Lock())
 
     @is_owner()
     @group(name="sticky", invoke_without_command=False)
@@ -29,57 +70,82 @@ class StickyMessageCog(Cog, name="Sticky Message"):
         *,
         message_content: str,
     ):
-        new_message = await channel.send(message_content)
-        msg, created = await StickyMessageModel.get_or_create(
-            channel_id=channel.id,
-            defaults={
-                "bot_last_message_id": new_message.id,
-                "message_content": message_content,
-            },
-        )
-        msg.message_content = message_content
-        try:
-            last_message = await channel.fetch_message(int(msg.bot_last_message_id))
-            await last_message.delete()
-        except discord.NotFound:
-            pass
-        msg.bot_last_message_id = str(new_message.id)
-        return await msg.save(update_fields=("bot_last_message_id",))
+        self._cancel_repost(channel.id)
+        async with self._lock(channel.id):
+            new_message = await channel.send(message_content)
+            msg, created = await StickyMessageModel.get_or_create(
+                channel_id=channel.id,
+                defaults={
+                    "bot_last_message_id": new_message.id,
+                    "message_content": message_content,
+                },
+            )
+            msg.message_content = message_content
+            if not created:
+                try:
+                    await channel.get_partial_message(msg.bot_last_message_id).delete()
+                except discord.NotFound:
+                    pass
+            msg.bot_last_message_id = new_message.id
+            await msg.save(update_fields=("bot_last_message_id", "message_content"))
+            self.stickies[channel.id] = msg
 
     @sticky.command("remove")
     @tortoise.transactions.atomic()
     async def sticky_remove_message(self, ctx: Context, channel: discord.TextChannel):
-        sticky_message = await StickyMessageModel.get_or_none(channel_id=channel.id)
-        if sticky_message is None:
-            return
-        await sticky_message.delete()
-        try:
-            message = await channel.fetch_message(
-                int(sticky_message.bot_last_message_id)
-            )
-            await message.delete()
-        except discord.NotFound:
-            pass
+        self._cancel_repost(channel.id)
+        async with self._lock(channel.id):
+            self.stickies.pop(channel.id, None)
+            sticky_message = await StickyMessageModel.get_or_none(channel_id=channel.id)
+            if sticky_message is None:
+                return
+            await sticky_message.delete()
+            try:
+                await channel.get_partial_message(
+                    sticky_message.bot_last_message_id
+                ).delete()
+            except discord.NotFound:
+                pass
 
-    @Cog.listener("on_message")
-    @tortoise.transactions.atomic()
-    async def on_message(self, message: discord.Message):
-        if message.author.bot:
-            return
-        msg = await StickyMessageModel.get_or_none(channel_id=message.channel.id)
-        if not msg:
-            return
+    @message_stage(channel_ids="stickies")
+    async def repost_sticky(self, message: discord.Message):
+        channel_id = message.channel.id
+        now = time.monotonic()
+        pending_since = self._pending_since.setdefault(channel_id, now)
+        task = self._reposts.get(channel_id)
+        if task is not None:
+            task.cancel()
+        delay = min(
+            self.REPOST_QUIET_PERIOD,
+            max(0.0, pending_since + self.REPOST_MAX_DELAY - now),
+        )
+        self._reposts[channel_id] = asyncio.create_task(
+            self._repost_after(message.channel, delay)  # type: ignore
+        )
 
-        new_message = await message.channel.send(msg.message_content)
+    async def _repost_after(self, channel: discord.TextChannel, delay: float) -> None:
+        await asyncio.sleep(delay)
+        # Past this point a new message schedules another repost instead of
+        # cancelling this one halfway through.
+        self._reposts.pop(channel.id, None)
+        self._pending_since.pop(channel.id, None)
+        async with self._lock(channel.id):
+            try:
+                await self.repost(channel)
+            except discord.HTTPException:
+                logger.exception("Reposting sticky message in %s failed", channel.id)
+
+    async def repost(self, channel: discord.TextChannel) -> None:
+        msg = self.stickies.get(channel.id)
+        if msg is None:
+            return
+        new_message = await channel.send(msg.message_content)
         try:
-            last_message = await message.channel.fetch_message(
-                int(msg.bot_last_message_id)
-            )
-            await last_message.delete()
+            await channel.get_partial_message(msg.bot_last_message_id).delete()
         except discord.NotFound:
             pass
-        msg.bot_last_message_id = str(new_message.id)
-        return await msg.save(update_fields=("bot_last_message_id",))
+        msg.bot_last_message_id = new_message.id
+        await msg.save(update_fields=("bot_last_message_id",))
 
 
 def setup(bot: CustomClient):
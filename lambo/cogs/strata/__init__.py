@@ -1,16 +1,18 @@
+from importlib import import_module
 from typing import Callable
 
 from lambo import CustomClient
 
-from .activity_tracker import setup as activity_tracker_setup
-from .color_management import setup as color_management_setup
-from .items_list import setup as items_list_setup
+# Not loaded: items_list, valentines
+EXTENSIONS = (
+    "activity_tracker",
+    "mention_channel",
+    "ping_block",
+    "color_management",
+    "reminder",
+    "charity_stream",
+)
 
-# from .valentines import setup as valentines_setup
-from .mention_channel import setup as mention_channel_setup
-from .ping_block import setup as ping_block_setup
-from .reminder import setup as reminder_setup
-from .charity_stream import setup as charity_stream_setup
 
 def apply_bot(bot: CustomClient):
     def inner(func: Callable[[CustomClient], None]) -> None:
@@ -20,14 +22,5 @@ def apply_bot(bot: CustomClient):
 
 
 def setup(bot: CustomClient):
-    for func in (
-        # valentines_setup(bot)
-        # items_list_setup,
-        activity_tracker_setup,
-        mention_channel_setup,
-        ping_block_setup,
-        color_management_setup,
-        reminder_setup,
-        charity_stream_setup
-    ):
-        func(bot)
+    for name in EXTENSIONS:
+        import_module(f"{__name__}.{name}").setup(bot)
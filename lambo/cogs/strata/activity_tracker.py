@@ -1,17 +1,20 @@
 import asyncio
 import json
+import logging
+from bisect import bisect_right
 from datetime import date, timedelta
-from typing import Optional
+from typing import Iterable, Optional
 
 import discord
 from discord.ext.commands import Cog, Context, check, command
+from discord.ext.tasks import loop
 from more_itertools import stagger
-from tortoise.expressions import F
 from tortoise.transactions import in_transaction
 
 from lambo import CustomClient
 from lambo.cogs.giveaway import GiveawayCog
 from lambo.cogs.strata.strata_cog import StrataCog
+from lambo.message_pipeline import message_stage
 from lambo.models.activity_tracker_model import (
     ExportedStageDict,
     StageModel,
@@ -21,6 +24,54 @@ from lambo.models.activity_tracker_model import (
 from lambo.models.strata_models import ActivityTrackerModel
 from lambo.utils import TimedeltaConverter, is_member
 
+logger = logging.getLogger(__name__)
+
+
+class ChannelDayCounter:
+    """
+    Message count of one channel on one day, with the channel's stages
+    sorted by the number of messages they need.
+    """
+
+    model: ActivityTrackerModel
+    messages_sent: int
+    flushed: int
+    _thresholds: list[int]
+    _stages: list[StageModel]
+    _next: int
+
+    def __init__(
+        self, model: ActivityTrackerModel, stages: Iterable[StageModel]
+    ) -> None:
+        self.model = model
+        self.messages_sent = model.messages_sent
+        self.flushed = model.messages_sent
+        self.set_stages(stages)
+
+    def set_stages(self, stages: Iterable[StageModel]) -> None:
+        self._stages = sorted(stages, key=lambda stage: stage.messages_needed)
+        self._thresholds = [stage.messages_needed for stage in self._stages]
+        self._next = bisect_right(self._thresholds, self.messages_sent)
+
+    @property
+    def dirty(self) -> bool:
+        return self.messages_sent != self.flushed
+
+    def increment(self) -> list[StageModel]:
+        """
+        Counts a message and returns the stages reached by exactly this one.
+        """
+        self.messages_sent += 1
+        reached: list[StageModel] = []
+        while (
+            self._next < len(self._thresholds)
+            and self._thresholds[self._next] <= self.messages_sent
+        ):
+            if self._thresholds[self._next] == self.messages_sent:
+                reached.append(self._stages[self._next])
+            self._next += 1
+        return reached
+
 
 class ActivityTracker(StrataCog, name="Activity Tracker"):
     ALLOWED_CHANNELS = [
@@ -30,6 +81,79 @@ class ActivityTracker(StrataCog, name="Activity Tracker"):
         951215423741907005,  # baranek_test
         412151174641221632,  # spam
     ]
+    FLUSH_INTERVAL = 30.0
+
+    counters: dict[tuple[int, date], ChannelDayCounter]
+    _counter_locks: dict[tuple[int, date], asyncio.Lock]
+
+    def __init__(self, bot: CustomClient) -> None:
+        super().__init__(bot)
+        self.counters = {}
+        self._counter_locks = {}
+        self.flush_counters.start()
+        self.bot.add_shutdown_hook(self.flush)
+
+    def cog_unload(self) -> None:
+        self.flush_counters.cancel()
+        self.bot.remove_shutdown_hook(self.flush)
+        self.bot.run_in_background(self.flush)
+
+    @loop(seconds=FLUSH_INTERVAL)
+    async def flush_counters(self):
+        # An exception would stop the loop for good, the counters stay dirty
+        # and the next tick (or the shutdown hook) writes them.
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Flushing activity counters failed")
+
+    async def flush(self) -> None:
+        dirty = [counter for counter in self.counters.values() if counter.dirty]
+        if dirty:
+            values = [counter.messages_sent for counter in dirty]
+            for counter, value in zip(dirty, values):
+                counter.model.messages_sent = value
+            await ActivityTrackerModel.bulk_update(
+                [counter.model for counter in dirty], ["messages_sent"]
+            )
+            for counter, value in zip(dirty, values):
+                counter.flushed = value
+        today = date.today()
+        for key, counter in list(self.counters.items()):
+            if key[1] < today and not counter.dirty:
+                del self.counters[key]
+                self._counter_locks.pop(key, None)
+
+    @staticmethod
+    async def get_or_create_model(channel_id: int, day: date) -> ActivityTrackerModel:
+        model, created = await ActivityTrackerModel.get_or_create(
+            channel_id=channel_id, date=day
+        )
+        if created:
+            default_stages = await StageModel.filter(default=True)
+            await model.stages.add(*default_stages)
+        return model
+
+    async def get_counter(
+        self, channel_id: int, day: Optional[date] = None
+    ) -> ChannelDayCounter:
+        key = (channel_id, day or date.today())
+        counter = self.counters.get(key)
+        if counter is not None:
+            return counter
+        async with self._counter_locks.setdefault(key, asyncio.Lock()):
+            counter = self.counters.get(key)
+            if counter is None:
+                async with in_transaction():
+                    model = await self.get_or_create_model(*key)
+                    stages = await model.stages.all()
+                counter = self.counters[key] = ChannelDayCounter(model, stages)
+        return counter
+
+    async def reload_stages(self, channel_id: Optional[int] = None) -> None:
+        for (counter_channel_id, _), counter in list(self.counters.items()):
+            if channel_id is None or counter_channel_id == channel_id:
+                counter.set_stages(await counter.model.stages.all())
 
     async def handle_stage(
         self, stage: StageModel, channel: discord.TextChannel
@@ -42,36 +166,15 @@ class ActivityTracker(StrataCog, name="Activity Tracker"):
             )
             await msg.pin()
 
-    @Cog.listener("on_message")
-    async def on_message(self, message: discord.Message):
-        if not message.guild:
-            return
-        if message.guild.id not in self.ALLOWED_GUILD_IDS:
-            return
-        if message.channel.id not in self.ALLOWED_CHANNELS:
-            return
-        if message.author.bot:
-            return
+    @message_stage(guild_ids=StrataCog.ALLOWED_GUILD_IDS, channel_ids=ALLOWED_CHANNELS)
+    async def track_activity(self, message: discord.Message):
         assert isinstance(message.channel, discord.TextChannel)
-        today = date.today()
-
-        async with in_transaction():
-            model, created = await ActivityTrackerModel.get_or_create(
-                channel_id=message.channel.id,
-                date=today,
-            )
-
-            if created:
-                default_stages = await StageModel.filter(default=True)
-                await model.stages.add(*default_stages)
-
-            await ActivityTrackerModel.filter(
-                channel_id=message.channel.id,
-                date=today,
-            ).update(messages_sent=F("messages_sent") + 1)
-
-            stages = await model.stages.filter(messages_needed=model.messages_sent)
-
+        counter = self.counters.get((message.channel.id, date.today()))
+        if counter is None:
+            counter = await self.get_counter(message.channel.id)
+        stages = counter.increment()
+        if not stages:
+            return
         await asyncio.gather(
             *[self.handle_stage(stage, message.channel) for stage in stages]
         )
@@ -146,14 +249,8 @@ class ActivityTracker(StrataCog, name="Activity Tracker"):
         assert channel is not None
         if channel.id not in self.ALLOWED_CHANNELS:
             return
-        # copy paste
-        today = date.today()
-        model, created = await ActivityTrackerModel.get_or_create(
-            channel_id=channel.id, date=today
-        )
-        if created:
-            default_stages = await StageModel.filter(default=True)
-            await model.stages.add(*default_stages)
+        counter = await self.get_counter(channel.id)
+        model = counter.model
 
         stage = await StageModel.get(idx=stage_index)
 
@@ -161,6 +258,7 @@ class ActivityTracker(StrataCog, name="Activity Tracker"):
             await model.stages.add(stage)
         else:
             await model.stages.remove(stage)
+        await self.reload_stages(channel.id)
 
         await ctx.reply(
             f"Stage {stage_index} is now {'enabled' if enable else 'disabled'} for channel {channel}"
@@ -176,15 +274,8 @@ class ActivityTracker(StrataCog, name="Activity Tracker"):
         assert channel is not None
         if channel.id not in self.ALLOWED_CHANNELS:
             return
-        today = date.today()
-        today = date.today()
-        model, created = await ActivityTrackerModel.get_or_create(
-            channel_id=channel.id, date=today
-        )
-        if created:
-            default_stages = await StageModel.filter(default=True)
-            await model.stages.add(*default_stages)
-        await ctx.reply(f"{model.messages_sent} messages sent in {channel}")
+        counter = await self.get_counter(channel.id)
+        await ctx.reply(f"{counter.messages_sent} messages sent in {channel}")
 
     @check(StrataCog.mod_only)
     @command(name="remove_stage")
@@ -192,6 +283,7 @@ class ActivityTracker(StrataCog, name="Activity Tracker"):
         assert is_member(ctx.author)
         model = await StageModel.get(idx=idx)
         await model.delete()
+        await self.reload_stages()
 
     @check(StrataCog.mod_only)
     @command(name="export_stages")
@@ -223,7 +315,7 @@ class ActivityTracker(StrataCog, name="Activity Tracker"):
         stages = [StageModel.from_dict(stage) for stage in exported_stages]
         async with in_transaction():
             model = await ActivityTrackerModel.filter(
-                channel_id=str(channel.id)
+                channel_id=channel.id
             ).get_or_none()
             if model is None:
                 model = ActivityTrackerModel(channel_id=channel.id, date=date.today())
@@ -233,6 +325,7 @@ class ActivityTracker(StrataCog, name="Activity Tracker"):
             for stage in stages:
                 await stage.save()
                 await model.stages.add(stage)
+        await self.reload_stages(channel.id)
         await ctx.send(f"Imported {len(stages)} stages for {channel}")
 
 
@@ -1,6 +1,7 @@
 from typing import TypeGuard
 from lambo import CustomClient
 from lambo.cogs.strata.strata_cog import StrataCog
+from lambo.message_pipeline import message_stage
 import discord
 from re import match
 
@@ -21,12 +22,9 @@ class CharityStreamCog(StrataCog):
 
     MESSAGE_REGEX = r"<@!?(\d+)>, pomyślnie przekazano użytkownikowi <@!?(\d+)> punkty w ilości \*\*(\d+)\*\*."
 
-    @StrataCog.listener("on_message")
-    async def on_message(self, message: discord.Message):
-        if message.guild is None:
-            return
-        if message.author.id != self.BRUNO_ID:
-            return
+    @message_stage(author_ids=[BRUNO_ID], bots=True)
+    async def thank_for_points(self, message: discord.Message):
+        assert message.guild is not None
         if len(message.embeds) != 1:
             return
         if message.embeds[0].title != "Punkty-przekaz":
@@ -9,6 +9,7 @@ from discord.ext.commands import Context, check, group
 from lambo import CustomClient
 from lambo.cogs.strata.strata_cog import StrataCog
 from lambo.models.color_role_model import ColorRoleModel
+from lambo.utils.caches import async_cached
 
 
 class ColorManagement(StrataCog, name="Color Management"):
@@ -40,6 +41,7 @@ class ColorManagement(StrataCog, name="Color Management"):
             _, created = await ColorRoleModel.get_or_create(
                 {"owner_id": user.id, "role_id": role.id}
             )
+            ColorManagement.is_color_owner.invalidate(self, user, role)
             if created:
                 await ctx.reply(f"Added color {role}")
             else:
@@ -51,6 +53,7 @@ class ColorManagement(StrataCog, name="Color Management"):
     @colors.command("remove")
     async def colors_remove_role(self, ctx: Context, *, role: discord.Role):
         removed = await ColorRoleModel.filter(role_id=role.id).delete()
+        ColorManagement.is_color_owner.clear()
         await ctx.reply(f"Removed {removed} color :)")
 
     @check(StrataCog.mod_only)
@@ -73,9 +76,10 @@ class ColorManagement(StrataCog, name="Color Management"):
                 print(role_name)
                 continue
             role_id = possible_roles[0]
-            models.append(ColorRoleModel(owner_id=owner_id, role_id=role_id))
+            models.append(ColorRoleModel(owner_id=int(owner_id), role_id=role_id))
         try:
             imported = await ColorRoleModel.bulk_create(models, ignore_conflicts=True)
+            ColorManagement.is_color_owner.clear()
             await ctx.reply(f"Imported {imported} roles")
         except:
             await ctx.reply("Something went wrong. Try binary deduction :)")
@@ -87,11 +91,14 @@ class ColorManagement(StrataCog, name="Color Management"):
         models = await ColorRoleModel.all().limit(20).offset(20 * (page - 1))
         strbuilder = [f"page {page} of circa {ceil(count / 20)}"]
         for model in models:
-            role = ctx.guild.get_role(int(model.role_id))
-            owner = ctx.guild.get_member(int(model.owner_id))
+            role = ctx.guild.get_role(model.role_id)
+            owner = ctx.guild.get_member(model.owner_id)
             strbuilder.append(f"{role} ({model.role_id}): {owner} ({model.owner_id})")
         await ctx.reply("\n".join(strbuilder))
 
+    @async_cached(
+        ttl=300, key=lambda self, user, role: (user.id, role.id), max_size=10_000
+    )
     async def is_color_owner(
         self, user: typing.Union[discord.Member, discord.User], role: discord.Role
     ) -> bool:
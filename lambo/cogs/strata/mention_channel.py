@@ -4,6 +4,7 @@ import discord
 from discord.ext.commands import Cog
 
 from lambo import CustomClient
+from lambo.message_pipeline import message_stage
 from lambo.utils import get_guild
 
 
@@ -21,10 +22,9 @@ class MentionChannelCog(Cog, name="Channel Mentioning"):
     def __init__(self, bot: CustomClient) -> None:
         self.bot = bot
 
-    @Cog.listener("on_message")
-    async def on_message(self, message: discord.Message):
-        if message.guild is not None and message.guild.id not in self.ALLOWED_GUILD_IDS:
-            return
+    # Channel names can be looked up in DMs too.
+    @message_stage(guild_ids=ALLOWED_GUILD_IDS, guild_only=False)
+    async def mention_channels(self, message: discord.Message):
         partial_names = self.MENTION_REGEX.findall(message.content)
         if not partial_names:
             return
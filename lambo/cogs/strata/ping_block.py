@@ -6,6 +6,7 @@ from discord.ext.commands import Cog, Context, command
 from discord.utils import escape_markdown, format_dt
 
 from lambo import CustomClient
+from lambo.message_pipeline import message_stage
 from lambo.utils import get_guild, get_role
 from lambo.utils.caches import TTLCache
 
@@ -33,14 +34,8 @@ class RolePingBlockCog(Cog, name="Role Ping Blocking"):
         self.bot = bot
         self.cache = TTLCache(expiration_time=self.PING_COOLDOWN)
 
-    @Cog.listener("on_message")
-    async def on_message(self, message: discord.Message):
-        if message.guild is not None and message.guild.id not in self.ALLOWED_GUILD_IDS:
-            return
-
-        if message.author.bot:
-            return
-
+    @message_stage(guild_ids=ALLOWED_GUILD_IDS)
+    async def block_role_ping(self, message: discord.Message):
         if self.blocked_role not in message.role_mentions:
             return
 
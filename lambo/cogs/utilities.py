@@ -1,15 +1,18 @@
+import asyncio
 import math
 import typing
 from inspect import unwrap
-from io import BytesIO
 
 import discord
 from discord.ext.commands import Cog, Context, FlagConverter, Greedy, command, flag
-from discord.ext.pages import PageGroup, Paginator
+from discord.ext.pages import Page, PageGroup, Paginator
 from discord.utils import escape_markdown
 
 from lambo import CustomClient
 from lambo.utils import FuzzyRoleConverter, codized, quoted, unwrap_channels
+from lambo.utils.export import EXPORT_FORMATS, MemberExport
+
+REACTION_FETCH_CONCURRENCY = 4
 
 
 class InroleFlags(FlagConverter):
@@ -17,11 +20,53 @@ class InroleFlags(FlagConverter):
     with_ids: bool = flag(name="with_ids", aliases=["ids"], default=True)
 
     page: int = flag(name="page", default=1)
+    export: bool = flag(name="export", default=False)
+    format: str = flag(name="format", aliases=["fmt"], default="txt")
+
+
+class RoleMembersPaginator(Paginator):
+    """
+    Pages through a sorted list of member ids. The pages are just their
+    indices, only the page that is shown is rendered.
+    """
+
+    def __init__(
+        self,
+        guild: discord.Guild,
+        member_ids: list[int],
+        prefix: str,
+        per_page: int,
+        with_ids: bool,
+    ) -> None:
+        self.guild = guild
+        self.member_ids = member_ids
+        self.prefix = prefix
+        self.per_page = per_page
+        self.with_ids = with_ids
+        self.pad_with = len(str(len(member_ids)))
+        page_count = max(math.ceil(len(member_ids) / per_page), 1)
+        super().__init__(pages=range(page_count))  # type: ignore
+
+    def get_page_content(self, page: typing.Any) -> Page:  # type: ignore
+        if not isinstance(page, int):
+            return super().get_page_content(page)
+        start = page * self.per_page
+        lines = []
+        for idx, member_id in enumerate(
+            self.member_ids[start : start + self.per_page], start + 1
+        ):
+            member = self.guild.get_member(member_id)
+            name = str(member) if member is not None else "(left the server)"
+            id_str = f"{member_id} " if self.with_ids else ""
+            lines.append(f"{idx:0{self.pad_with}}. {id_str}{name}")
+        text = "\n".join(lines)
+        return Page(content=f"{self.prefix}\n{codized(text)}")
 
 
 class ReactedFlags(FlagConverter):
     mentions: bool = flag(name="mentions", aliases=["mention"], default=False)
     hide_names: bool = flag(name="hide_names", aliases=["hide"], default=False)
+    format: str = flag(name="format", aliases=["fmt"], default="txt")
 
 
 class UtilitiesCog(Cog, name="Utilities"):
@@ -50,41 +95,50 @@ class UtilitiesCog(Cog, name="Utilities"):
             await ctx.reply("Please enter a number between 1 and 30.")
             return
         role: discord.Role = _role  # type: ignore
-        members = []
-        pad_with = math.floor(math.log10(min(len(role.members), 1000))) + 1
-        for idx, member in enumerate(role.members[:1000]):
-            ordering = f"{(idx + 1):0{pad_with}}. "
-            id_str = f"{member.id} " if flags.with_ids else ""
-            members.append(f"{ordering}{id_str}{member}")
-        # Join every per_page members in one list
-        members_pages = [
-            "\n".join(members[i : i + flags.per_page])
-            for i in range(0, len(members), flags.per_page)
-        ]
-        # Prepend every list with the custom message
+        # A snapshot, so pages stay stable while members come and go.
+        member_ids = sorted(self.bot.role_index.member_ids(role))
+        if flags.export:
+            await self.export_role_members(ctx, role, member_ids, flags)
+            return
         id_str = f" ({role.id})" if flags.with_ids else ""
-
-        prefix = (
+        prefix = quoted(
             f"Members in role `{role.name}`{id_str}.\n"
-            f"Total members: {len(role.members)}.\n"
+            f"Total members: {len(member_ids)}.\n"
         )
-        length_disclaimer = (
-            f"Showing only first 1000 members.\n" if len(role.members) > 1000 else ""
+        paginator = RoleMembersPaginator(
+            role.guild, member_ids, prefix, flags.per_page, flags.with_ids
         )
-
-        prefix += length_disclaimer
-        prefix = quoted(prefix)
-        members_pages = [f"{prefix}\n{codized(page)}" for page in members_pages]
-        if flags.page not in range(1, len(members_pages) + 1):
+        if flags.page not in range(1, len(paginator.pages) + 1):
             await ctx.reply(
-                f"That page does not exist. Please specify page between 1 and {len(members_pages)}."
+                f"That page does not exist. Please specify page between 1 and {len(paginator.pages)}."
             )
             return
-        paginator = Paginator(pages=members_pages)
         paginator.current_page = flags.page - 1
 
         await paginator.send(ctx)
 
+    async def export_role_members(
+        self,
+        ctx: Context,
+        role: discord.Role,
+        member_ids: list[int],
+        flags: InroleFlags,
+    ) -> None:
+        if flags.format not in EXPORT_FORMATS:
+            await ctx.reply(f"Format must be one of: {', '.join(EXPORT_FORMATS)}.")
+            return
+
+        def format_member(member: discord.abc.User) -> str:
+            return f"{member.id} {member}" if flags.with_ids else str(member)
+
+        export = MemberExport(flags.format, format_member)
+        export.section(role.name, len(member_ids))
+        for member_id in member_ids:
+            member = role.guild.get_member(member_id)
+            if member is not None:
+                export.member(member)
+        await ctx.reply(file=export.to_file(f"inrole-{role.id}"))
+
     @command("searchin")
     async def searchin(
         self,
@@ -116,46 +170,59 @@ class UtilitiesCog(Cog, name="Utilities"):
     ):
         assert ctx.guild is not None
         assert isinstance(message.channel, discord.abc.GuildChannel)
-        members = filter(
-            lambda m: not m.bot, role.members if role else message.channel.members
+        if flags.format not in EXPORT_FORMATS:
+            await ctx.reply(f"Format must be one of: {', '.join(EXPORT_FORMATS)}.")
+            return
+        guild = ctx.guild
+        semaphore = asyncio.Semaphore(REACTION_FETCH_CONCURRENCY)
+
+        async def fetch_user_ids(reaction: discord.Reaction) -> list[int]:
+            async with semaphore:
+                return [
+                    user.id
+                    async for user in reaction.users(limit=None)
+                    if not user.bot and isinstance(user, discord.Member)
+                ]
+
+        reactions = message.reactions
+        users_per_reaction = await asyncio.gather(
+            *(fetch_user_ids(reaction) for reaction in reactions)
         )
-        reacted_users: set[discord.Member] = set()
-        reactions_dict: dict[str, list[discord.Member]] = {}
-        for reaction in message.reactions:
-            users: list[discord.Member] = await (  # type: ignore
-                reaction.users(limit=None)
-                .filter(lambda user: not user.bot and isinstance(user, discord.Member))
-                .flatten()
-            )
-            reacted_users.update(users)
-            emoji_name = (
-                reaction.emoji
-                if isinstance(reaction.emoji, str)
-                else reaction.emoji.name
-            )
-            reactions_dict[emoji_name] = users
-        not_reacted = set(members) - reacted_users
+        reacted_ids = {user_id for ids in users_per_reaction for user_id in ids}
+        if role is not None:
+            member_ids = set(self.bot.role_index.member_ids(role))
+        else:
+            member_ids = {member.id for member in message.channel.members}
+        not_reacted = [
+            member
+            for member in self.bot.role_index.members(guild, member_ids - reacted_ids)
+            if not member.bot
+        ]
 
-        def format_user(user: discord.Member) -> str:
+        def format_user(user: discord.abc.User) -> str:
             if flags.mentions and flags.hide_names:
                 return user.mention
             elif flags.mentions:
                 return f"{user.mention} ({user})"
             return str(user)
 
-        buffer = ""
-
-        for emoji, users in reactions_dict.items():
-            buffer += f"{emoji}: {len(users)}\n"
-            for user in users:
-                buffer += f"\t{format_user(user)}\n"
-        buffer += f"\nNot reacted: {len(not_reacted)}\n"
-        for user in not_reacted:
-            buffer += f"\t{format_user(user)}\n"
-
-        await ctx.reply(
-            file=discord.File(BytesIO(buffer.encode("utf-8")), filename="reacted.txt")
-        )
+        export = MemberExport(flags.format, format_user)
+        for reaction, user_ids in zip(reactions, users_per_reaction):
+            emoji_name = (
+                reaction.emoji
+                if isinstance(reaction.emoji, str)
+                else reaction.emoji.name
+            )
+            export.section(emoji_name, len(user_ids))
+            for user_id in user_ids:
+                member = guild.get_member(user_id)
+                if member is not None:
+                    export.member(member)
+        export.section("Not reacted", len(not_reacted))
+        for member in not_reacted:
+            export.member(member)
+
+        await ctx.reply(file=export.to_file("reacted"))
 
 
 def setup(bot: CustomClient):
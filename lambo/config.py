@@ -1,6 +1,8 @@
-from typing import Callable, Optional
+from typing import Any, Callable, Optional
+from urllib.parse import parse_qs, urlparse
 
 from pydantic import BaseSettings, Field
+from tortoise.backends.base.config_generator import expand_db_url
 
 
 def default_list(*l: str) -> Callable[[], list[str]]:
@@ -10,7 +12,29 @@ def default_list(*l: str) -> Callable[[], list[str]]:
 class Settings(BaseSettings):
     prefix: str = "b!"
     db_url: str = "sqlite://:memory:"
-    extensions: list[str] = Field(default_factory=default_list("lambo.cogs"))
+    # SQLite PRAGMAs, applied to every connection.
+    db_journal_mode: str = "WAL"
+    db_synchronous: str = "NORMAL"
+    db_busy_timeout: int = 5000  # milliseconds
+    db_cache_size: int = -64000  # negative values are KiB
+    db_mmap_size: int = 256 * 1024 * 1024  # bytes
+    # Connection pool size for Postgres and MySQL.
+    db_pool_min: int = 1
+    db_pool_max: int = 10
+    # Prometheus metrics are served on this port when it is set.
+    metrics_host: str = "127.0.0.1"
+    metrics_port: Optional[int] = None
+    extensions: list[str] = Field(
+        default_factory=default_list(
+            "lambo.cogs.count_emoji",
+            "lambo.cogs.giveaway",
+            "lambo.cogs.moderation_utils",
+            "lambo.cogs.sticky_message",
+            "lambo.cogs.utilities",
+            "lambo.cogs.add_reaction",
+            "lambo.cogs.diagnostics",
+        )
+    )
     models: list[str] = Field(default_factory=default_list("lambo.models"))
     non_default_extensions: list[str] = Field(default_factory=list)
     non_default_models: list[str] = Field(default_factory=list)
@@ -29,3 +53,28 @@ class Settings(BaseSettings):
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
+
+    def db_connection(self) -> dict[str, Any]:
+        """
+        Tortoise connection config for `db_url` with the tuning options
+        applied. Parameters given in the URL itself take precedence.
+        """
+        connection = expand_db_url(self.db_url)
+        credentials: dict[str, Any] = connection["credentials"]
+        if connection["engine"] == "tortoise.backends.sqlite":
+            # The SQLite client runs every unknown credential as a PRAGMA.
+            options = {
+                "journal_mode": self.db_journal_mode,
+                "synchronous": self.db_synchronous,
+                "busy_timeout": self.db_busy_timeout,
+                "cache_size": self.db_cache_size,
+                "mmap_size": self.db_mmap_size,
+            }
+        else:
+            options = {"minsize": self.db_pool_min, "maxsize": self.db_pool_max}
+        # expand_db_url fills in defaults of its own, so check the URL.
+        given = parse_qs(urlparse(self.db_url).query)
+        credentials.update(
+            (key, value) for key, value in options.items() if key not in given
+        )
+        return connection
@@ -1,17 +1,31 @@
-from typing import Optional
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Coroutine, Optional, Sequence
 
 import discord
 from discord.cog import Cog
-from discord.ext.commands import Bot, when_mentioned_or
+from discord.ext.commands import Bot, Context, when_mentioned_or
 
 from lambo.config import Settings
+from lambo.message_pipeline import MessagePipeline
+from lambo.utils.caches import async_cached
+from lambo.utils.emoji_index import EmojiIndex
+from lambo.utils.metrics import Metrics
+from lambo.utils.role_index import RoleIndex
 
 LOGGER_FORMAT = "[%(levelname)s][%(asctime)s][%(name)s]: %(message)s"
 
+logger = logging.getLogger(__name__)
+
 
 class CustomClient(Bot):
     _settings: Settings
-
+    message_pipeline: MessagePipeline
+    emoji_index: EmojiIndex
+    role_index: RoleIndex
+    metrics: Metrics
+    _shutdown_hooks: list[Callable[[], Awaitable[Any]]]
+    _background_hooks: set[asyncio.Task]
 
     def __init__(self, settings: Settings, *args, **kwargs):
         prefix = settings.prefix
@@ -28,6 +42,12 @@ class CustomClient(Bot):
                 setattr(intents, intent, True)
 
         self._settings = settings
+        self.message_pipeline = MessagePipeline()
+        self.emoji_index = EmojiIndex()
+        self.role_index = RoleIndex()
+        self.metrics = Metrics()
+        self._shutdown_hooks = []
+        self._background_hooks = set()
 
         allowed_mentions = discord.AllowedMentions.none()
         allowed_mentions.replied_user = True
@@ -44,11 +64,125 @@ class CustomClient(Bot):
             raise ValueError("No token provided")
         return await super().start(self._settings.token)
 
+    def add_shutdown_hook(self, hook: Callable[[], Awaitable[Any]]) -> None:
+        self._shutdown_hooks.append(hook)
+
+    def remove_shutdown_hook(self, hook: Callable[[], Awaitable[Any]]) -> None:
+        if hook in self._shutdown_hooks:
+            self._shutdown_hooks.remove(hook)
+
+    def run_in_background(self, hook: Callable[[], Awaitable[Any]]) -> None:
+        """
+        Runs `hook` without waiting for it, like the final flush of a cog
+        that is unloaded. Failures are logged and closing waits for it.
+        """
+        task = asyncio.create_task(self._run_hook(hook))
+        self._background_hooks.add(task)
+        task.add_done_callback(self._background_hooks.discard)
+
+    async def _run_hook(self, hook: Callable[[], Awaitable[Any]]) -> None:
+        try:
+            await hook()
+        except Exception:
+            logger.exception("Shutdown hook %r failed", hook)
+
+    async def close(self) -> None:
+        hooks, self._shutdown_hooks = self._shutdown_hooks, []
+        for hook in hooks:
+            await self._run_hook(hook)
+        if self._background_hooks:
+            await asyncio.gather(*self._background_hooks)
+        await super().close()
+
+    @async_cached(ttl=300, key=lambda self, message: message.guild and message.guild.id)
+    async def get_prefix(self, message: discord.Message) -> list[str] | str:
+        return await super().get_prefix(message)
+
+    @async_cached(ttl=3600, key=lambda self, user: user.id, max_size=10_000)
+    async def is_owner(self, user: discord.abc.User) -> bool:
+        return await super().is_owner(user)
+
+    def _schedule_event(
+        self,
+        coro: Callable[..., Coroutine[Any, Any, Any]],
+        event_name: str,
+        *args: Any,
+        **kwargs: Any,
+    ) -> asyncio.Task:
+        # Every listener and message pipeline stage is scheduled through here.
+        return super()._schedule_event(
+            self.metrics.wrap("listener", coro), event_name, *args, **kwargs
+        )
+
+    async def invoke(self, ctx: Context) -> None:
+        if ctx.command is None:
+            return await super().invoke(ctx)
+        name = ctx.command.qualified_name
+        with self.metrics.track("command", name) as metrics:
+            await super().invoke(ctx)
+        # Command errors are handled inside invoke and don't propagate.
+        if ctx.command_failed:
+            metrics.errors += 1
+
+    async def starts_with_prefix(self, message: discord.Message) -> bool:
+        prefixes = await self.get_prefix(message)
+        if isinstance(prefixes, str):
+            prefixes = [prefixes]
+        return message.content.startswith(tuple(prefixes))
+
+    async def on_message(self, message: discord.Message) -> None:
+        stages = self.message_pipeline.match(message)
+        is_command: Optional[bool] = None
+        for stage in stages:
+            if stage.skip_commands:
+                if is_command is None:
+                    is_command = await self.starts_with_prefix(message)
+                if is_command:
+                    continue
+            self._schedule_event(stage.callback, stage.name, message)
+        await self.process_commands(message)
+
+    async def on_guild_emojis_update(
+        self,
+        guild: discord.Guild,
+        before: Sequence[discord.Emoji],
+        after: Sequence[discord.Emoji],
+    ) -> None:
+        self.emoji_index.update(guild, before, after)
+
+    async def on_member_join(self, member: discord.Member) -> None:
+        self.role_index.add_member(member)
+
+    async def on_member_remove(self, member: discord.Member) -> None:
+        self.role_index.remove_member(member)
+
+    async def on_member_update(
+        self, before: discord.Member, after: discord.Member
+    ) -> None:
+        self.role_index.update_member(before, after)
+
+    async def on_guild_role_delete(self, role: discord.Role) -> None:
+        self.role_index.remove_role(role)
+
+    async def on_guild_available(self, guild: discord.Guild) -> None:
+        # The member cache may have changed while the guild was away.
+        self.role_index.discard(guild.id)
+
+    async def on_guild_unavailable(self, guild: discord.Guild) -> None:
+        self.role_index.discard(guild.id)
+
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        self.emoji_index.discard(guild.id)
+        self.role_index.discard(guild.id)
+
     def add_cog(self, cog: Cog, *, override: bool = False) -> None:
-        return super().add_cog(cog, override=override)
+        super().add_cog(cog, override=override)
+        self.message_pipeline.add_cog(cog)
 
     def remove_cog(self, name: str) -> Optional[Cog]:
         value = super().remove_cog(name)
+        if value is not None:
+            self.message_pipeline.remove_cog(value.qualified_name)
         return value
 
     def load_extension(self, name: str, *, package: Optional[str] = None) -> list[str]:
@@ -0,0 +1,148 @@
+import inspect
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Callable,
+    Collection,
+    Container,
+    Coroutine,
+    Optional,
+    TypeVar,
+    Union,
+)
+
+import discord
+from discord.cog import Cog
+
+MessageCallback = Callable[[discord.Message], Coroutine[Any, Any, Any]]
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Either a collection of ids or the name of a cog attribute holding one.
+# Attribute names are resolved when the cog is added, so cogs can keep
+# a mutable set/dict and update it in place.
+IdFilter = Union[Collection[int], str]
+
+
+@dataclass(frozen=True)
+class StagePredicate:
+    guild_ids: Optional[IdFilter] = None
+    channel_ids: Optional[IdFilter] = None
+    author_ids: Optional[IdFilter] = None
+    bots: bool = False
+    skip_commands: bool = False
+    guild_only: bool = True
+
+
+@dataclass(frozen=True)
+class MessageStage:
+    name: str
+    owner: str
+    callback: MessageCallback
+    guild_ids: Optional[Container[int]]
+    channel_ids: Optional[Container[int]]
+    author_ids: Optional[Container[int]]
+    bots: bool
+    skip_commands: bool
+    guild_only: bool
+
+    def matches(self, message: discord.Message) -> bool:
+        if not self.bots and message.author.bot:
+            return False
+        guild = message.guild
+        if guild is None:
+            # `guild_ids` only filters guild messages, DMs pass unless the
+            # stage is guild only.
+            if self.guild_only:
+                return False
+        elif self.guild_ids is not None and guild.id not in self.guild_ids:
+            return False
+        if self.channel_ids is not None and message.channel.id not in self.channel_ids:
+            return False
+        if self.author_ids is not None and message.author.id not in self.author_ids:
+            return False
+        return True
+
+
+def message_stage(
+    *,
+    guild_ids: Optional[IdFilter] = None,
+    channel_ids: Optional[IdFilter] = None,
+    author_ids: Optional[IdFilter] = None,
+    bots: bool = False,
+    skip_commands: bool = False,
+    guild_only: bool = True,
+) -> Callable[[F], F]:
+    """
+    Marks a cog method as a stage of the client's message pipeline.
+
+    The predicates are checked by the client before anything is scheduled,
+    so the method is only called for messages it cares about. With
+    `guild_only=False` it also gets DMs, whatever `guild_ids` holds.
+    """
+    predicate = StagePredicate(
+        guild_ids=guild_ids,
+        channel_ids=channel_ids,
+        author_ids=author_ids,
+        bots=bots,
+        skip_commands=skip_commands,
+        guild_only=guild_only,
+    )
+
+    def decorator(func: F) -> F:
+        if not inspect.iscoroutinefunction(func):
+            raise TypeError("Message stage must be a coroutine function.")
+        func.__message_stage__ = predicate  # type: ignore
+        return func
+
+    return decorator
+
+
+def _resolve_ids(cog: Cog, ids: Optional[IdFilter]) -> Optional[Container[int]]:
+    if ids is None:
+        return None
+    if isinstance(ids, str):
+        return getattr(cog, ids)
+    if isinstance(ids, (set, frozenset, dict)):
+        return ids
+    return frozenset(ids)
+
+
+class MessagePipeline:
+    _stages: list[MessageStage]
+
+    def __init__(self) -> None:
+        self._stages = []
+
+    @property
+    def stages(self) -> tuple[MessageStage, ...]:
+        return tuple(self._stages)
+
+    def add_stage(self, stage: MessageStage) -> None:
+        self._stages.append(stage)
+
+    def add_cog(self, cog: Cog) -> None:
+        for name, member in inspect.getmembers(type(cog)):
+            predicate: Optional[StagePredicate] = getattr(
+                member, "__message_stage__", None
+            )
+            if predicate is None:
+                continue
+            self.add_stage(
+                MessageStage(
+                    name=f"{cog.qualified_name}.{name}",
+                    owner=cog.qualified_name,
+                    callback=getattr(cog, name),
+                    guild_ids=_resolve_ids(cog, predicate.guild_ids),
+                    channel_ids=_resolve_ids(cog, predicate.channel_ids),
+                    author_ids=_resolve_ids(cog, predicate.author_ids),
+                    bots=predicate.bots,
+                    skip_commands=predicate.skip_commands,
+                    guild_only=predicate.guild_only,
+                )
+            )
+
+    def remove_cog(self, name: str) -> None:
+        self._stages = [stage for stage in self._stages if stage.owner != name]
+
+    def match(self, message: discord.Message) -> list[MessageStage]:
+        return [stage for stage in self._stages if stage.matches(message)]
@@ -0,0 +1,303 @@
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, Optional, Type
+
+from tortoise import Tortoise, connections
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.exceptions import OperationalError
+from tortoise.models import Model
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_TABLE = "lambo_schema"
+# The migration steps only know how to change tables on these databases.
+SUPPORTED_DIALECTS = ("sqlite", "postgres", "mysql")
+
+MigrationStep = Callable[[BaseDBAsyncClient], Awaitable[None]]
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    apply: MigrationStep
+
+
+MIGRATIONS: list[Migration] = []
+
+
+def migration(
+    version: int, description: str
+) -> Callable[[MigrationStep], MigrationStep]:
+    """
+    Registers a schema migration step. Steps run in version order, once.
+    They also run on databases that already have the newest layout (for
+    example fresh ones created by step 1), so they must be idempotent.
+    """
+
+    def decorator(func: MigrationStep) -> MigrationStep:
+        if any(existing.version == version for existing in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append(Migration(version, description, func))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return func
+
+    return decorator
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+def models_fingerprint() -> str:
+    """
+    Table names of all registered models. When a new model is configured,
+    its table is created even if no migration is pending.
+    """
+    return ",".join(
+        sorted(
+            model._meta.db_table
+            for app in Tortoise.apps.values()
+            for model in app.values()
+        )
+    )
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+async def get_schema_state(connection: BaseDBAsyncClient) -> tuple[int, str]:
+    await connection.execute_script(
+        f"CREATE TABLE IF NOT EXISTS {SCHEMA_TABLE} ("
+        "id INT NOT NULL PRIMARY KEY, version INT NOT NULL, models TEXT NOT NULL)"
+    )
+    rows = await connection.execute_query_dict(
+        f"SELECT version, models FROM {SCHEMA_TABLE} WHERE id = 1"
+    )
+    if not rows:
+        return 0, ""
+    return int(rows[0]["version"]), str(rows[0]["models"])
+
+
+async def set_schema_state(
+    connection: BaseDBAsyncClient, version: int, fingerprint: str
+) -> None:
+    await connection.execute_script(f"DELETE FROM {SCHEMA_TABLE}")
+    await connection.execute_script(
+        f"INSERT INTO {SCHEMA_TABLE} (id, version, models) "
+        f"VALUES (1, {int(version)}, {_quote(fingerprint)})"
+    )
+
+
+async def migrate(connection: Optional[BaseDBAsyncClient] = None) -> list[Migration]:
+    """
+    Brings the database schema up to date and returns the applied steps.
+    When it already is, this costs a single query.
+    """
+    if connection is None:
+        connection = connections.get("default")
+    version, fingerprint = await get_schema_state(connection)
+    expected_fingerprint = models_fingerprint()
+    pending = [m for m in MIGRATIONS if m.version > version]
+    if not pending and fingerprint == expected_fingerprint:
+        return []
+    dialect = connection.capabilities.dialect
+    if pending and dialect not in SUPPORTED_DIALECTS:
+        # Checked up front, failing halfway would leave a half-converted schema.
+        raise RuntimeError(
+            f"Schema migrations don't support {dialect}, "
+            f"use one of: {', '.join(SUPPORTED_DIALECTS)}"
+        )
+
+    if fingerprint != expected_fingerprint:
+        logger.info("Models changed, creating missing tables")
+        await Tortoise.generate_schemas(safe=True)
+    for step in pending:
+        logger.info("Applying migration %s: %s", step.version, step.description)
+        await step.apply(connection)
+        await set_schema_state(connection, step.version, fingerprint)
+    await set_schema_state(
+        connection, max(version, latest_version()), expected_fingerprint
+    )
+    return pending
+
+
+@migration(1, "Create tables")
+async def create_tables(connection: BaseDBAsyncClient) -> None:
+    # Databases created before versioning only get the missing tables here,
+    # later steps convert their existing ones.
+    await Tortoise.generate_schemas(safe=True)
+
+
+# Discord ids that used to be stored as CharField(max_length=22).
+SNOWFLAKE_COLUMNS: dict[str, tuple[str, ...]] = {
+    "UsedEmojiModel": ("used_by",),
+    "GiveawayModel": ("message_id", "channel_id"),
+    "StickyMessageModel": ("channel_id", "bot_last_message_id"),
+    "AddReactionModel": ("channel_id", "emoji_id"),
+    "ActivityTrackerModel": ("channel_id",),
+    "ColorRoleModel": ("role_id", "owner_id"),
+}
+
+
+def registered_models(names: Iterable[str]) -> list[Type[Model]]:
+    # The strata models are only registered when they are configured.
+    wanted = set(names)
+    return [
+        model
+        for app in Tortoise.apps.values()
+        for name, model in app.items()
+        if name in wanted
+    ]
+
+
+def model_indexes(model: Type[Model]) -> list[tuple[str, ...]]:
+    projection = model._meta.fields_db_projection
+    indexes = [
+        (projection[name],)
+        for name, field in model._meta.fields_map.items()
+        if field.index and not field.pk and name in projection
+    ]
+    indexes.extend(
+        tuple(projection.get(name, name) for name in index)
+        for index in model._meta.indexes
+    )
+    return indexes
+
+
+async def rebuild_sqlite_table(
+    connection: BaseDBAsyncClient, model: Type[Model], columns: tuple[str, ...]
+) -> None:
+    """
+    SQLite can't change the type of a column, so the table is renamed, created
+    again from the model and the rows are copied over.
+    """
+    table = model._meta.db_table
+    old_table = f"{table}__old"
+    info = await connection.execute_query_dict(f'PRAGMA table_info("{table}")')
+    types = {row["name"]: str(row["type"]).upper() for row in info}
+    if all(types.get(column) == "BIGINT" for column in columns):
+        return
+    indexes = await connection.execute_query_dict(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? "
+        "AND name NOT LIKE 'sqlite_autoindex%'",
+        [table],
+    )
+    db_columns = [
+        column
+        for column in model._meta.fields_db_projection.values()
+        if column in types
+    ]
+    selected = [
+        f'CAST("{column}" AS INTEGER)' if column in columns else f'"{column}"'
+        for column in db_columns
+    ]
+    await connection.execute_script("PRAGMA foreign_keys=OFF")
+    try:
+        # Index names are global and the new table reuses them.
+        for index in indexes:
+            await connection.execute_script(f'DROP INDEX "{index["name"]}"')
+        # Keeps references from other tables (like the activity stages join
+        # table) pointing at the name instead of following the rename.
+        await connection.execute_script("PRAGMA legacy_alter_table=ON")
+        await connection.execute_script(
+            f'ALTER TABLE "{table}" RENAME TO "{old_table}"'
+        )
+        await connection.execute_script("PRAGMA legacy_alter_table=OFF")
+        await Tortoise.generate_schemas(safe=True)
+        quoted = ", ".join(f'"{column}"' for column in db_columns)
+        await connection.execute_script(
+            f'INSERT INTO "{table}" ({quoted}) '
+            f'SELECT {", ".join(selected)} FROM "{old_table}"'
+        )
+        await connection.execute_script(f'DROP TABLE "{old_table}"')
+    finally:
+        await connection.execute_script("PRAGMA foreign_keys=ON")
+
+
+async def alter_to_bigint(
+    connection: BaseDBAsyncClient, model: Type[Model], columns: tuple[str, ...]
+) -> None:
+    table = model._meta.db_table
+    dialect = connection.capabilities.dialect
+    for column in columns:
+        null = model._meta.fields_map[column].null
+        if dialect == "postgres":
+            await connection.execute_script(
+                f'ALTER TABLE "{table}" ALTER COLUMN "{column}" '
+                f'TYPE BIGINT USING "{column}"::bigint'
+            )
+        else:
+            await connection.execute_script(
+                f"ALTER TABLE `{table}` MODIFY `{column}` BIGINT "
+                + ("NULL" if null else "NOT NULL")
+            )
+
+    await create_indexes(connection, model)
+
+
+async def create_indexes(connection: BaseDBAsyncClient, model: Type[Model]) -> None:
+    # Uses the names generate_schemas would give them, so fresh databases
+    # don't get duplicates.
+    table = model._meta.db_table
+    generator = connection.schema_generator(connection)
+    for index in model_indexes(model):
+        name = generator._generate_index_name("idx", model, list(index))
+        fields = ", ".join(generator.quote(column) for column in index)
+        if connection.capabilities.dialect != "mysql":
+            await connection.execute_script(
+                f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({fields})'
+            )
+            continue
+        try:
+            await connection.execute_script(
+                f"CREATE INDEX `{name}` ON `{table}` ({fields})"
+            )
+        except OperationalError:
+            # MySQL has no IF NOT EXISTS for indexes, the index is there.
+            pass
+
+
+async def add_column(
+    connection: BaseDBAsyncClient, model: Type[Model], column: str, sql_type: str
+) -> None:
+    table = model._meta.db_table
+    dialect = connection.capabilities.dialect
+    if dialect == "postgres":
+        await connection.execute_script(
+            f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS "{column}" {sql_type}'
+        )
+    elif dialect == "sqlite":
+        info = await connection.execute_query_dict(f'PRAGMA table_info("{table}")')
+        if all(row["name"] != column for row in info):
+            await connection.execute_script(
+                f'ALTER TABLE "{table}" ADD COLUMN "{column}" {sql_type}'
+            )
+    else:
+        try:
+            await connection.execute_script(
+                f"ALTER TABLE `{table}` ADD COLUMN `{column}` {sql_type}"
+            )
+        except OperationalError:
+            # Duplicate column, it was already added.
+            pass
+
+
+@migration(2, "Store Discord ids as integers and add composite indexes")
+async def snowflake_columns(connection: BaseDBAsyncClient) -> None:
+    for model in registered_models(SNOWFLAKE_COLUMNS):
+        columns = SNOWFLAKE_COLUMNS[model.__name__]
+        if connection.capabilities.dialect == "sqlite":
+            await rebuild_sqlite_table(connection, model, columns)
+        else:
+            await alter_to_bigint(connection, model, columns)
+
+
+@migration(3, "Key emoji usages by guild and emoji id")
+async def emoji_usage_ids(connection: BaseDBAsyncClient) -> None:
+    # Older rows keep NULL ids until `emojis backfill-rollup` assigns them.
+    for model in registered_models(["UsedEmojiModel"]):
+        await add_column(connection, model, "guild_id", "BIGINT NULL")
+        await add_column(connection, model, "emoji_id", "BIGINT NULL")
+        await create_indexes(connection, model)
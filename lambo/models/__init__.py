@@ -1,6 +1,17 @@
 from .add_reaction_model import AddReactionModel
+from .bulk_job_model import BulkJobModel
+from .emoji_usage_rollup_model import EmojiUsageDailyModel
 from .giveway_model import GiveawayModel
+from .history_checkpoint_model import HistoryCheckpointModel
 from .sticky_message_model import StickyMessageModel
 from .used_emoji_model import UsedEmojiModel
 
-__models__ = [GiveawayModel, UsedEmojiModel, StickyMessageModel, AddReactionModel]
+__models__ = [
+    GiveawayModel,
+    UsedEmojiModel,
+    StickyMessageModel,
+    AddReactionModel,
+    EmojiUsageDailyModel,
+    HistoryCheckpointModel,
+    BulkJobModel,
+]
@@ -7,7 +7,7 @@ from tortoise.models import Model
 
 
 class ActivityTrackerModel(Model):
-    channel_id: str = fields.CharField(max_length=22)  # channel id
+    channel_id: int = fields.BigIntField()  # channel id
     date: datetime_date = fields.DateField()
     messages_sent: int = fields.IntField(default=0)
     stages: fields.ManyToManyRelation["StageModel"] = fields.ManyToManyField(
@@ -15,6 +15,7 @@ class ActivityTrackerModel(Model):
     )
 
     class Meta:
+        # Also serves as the (channel_id, date) lookup index.
         unique_together = ("channel_id", "date")
 
 
@@ -68,8 +69,7 @@ class StageModel(Model):
     )  # only if stage_type is GIVEAWAY
 
     @staticmethod
-    async def export_stages_for(channel_id: str | int) -> list["StageModel"]:
-        channel_id = str(channel_id)
+    async def export_stages_for(channel_id: int) -> list["StageModel"]:
         stages = await StageModel.filter(collection__channel_id=channel_id)
         return stages
 
@@ -3,5 +3,5 @@ from tortoise.models import Model
 
 
 class AddReactionModel(Model):
-    channel_id: str = fields.CharField(max_length=22)  # channel id
-    emoji_id: str = fields.CharField(max_length=22)  # emoji id
+    channel_id: int = fields.BigIntField(index=True)  # channel id
+    emoji_id: int = fields.BigIntField()  # emoji id
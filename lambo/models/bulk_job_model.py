@@ -0,0 +1,17 @@
+from datetime import datetime
+from typing import Optional
+
+from tortoise import fields
+from tortoise.models import Model
+
+
+class BulkJobModel(Model):
+    # Identifies the job, e.g. "fuse:<guild id>:<from role id>:<to role id>".
+    key: str = fields.CharField(max_length=128, unique=True)
+    guild_id: int = fields.BigIntField()  # guild id
+    # Members are processed in id order, all up to this one are finished.
+    last_member_id: Optional[int] = fields.BigIntField(null=True)  # member id
+    processed: int = fields.IntField(default=0)
+    failures: dict[str, str] = fields.JSONField(default=dict)  # member id -> error
+    done: bool = fields.BooleanField(default=False)
+    updated_at: datetime = fields.DatetimeField(auto_now=True)
@@ -7,8 +7,9 @@ from tortoise.models import Model
 
 
 class ColorRoleModel(Model):
-    role_id = fields.CharField(max_length=22, pk=True, unique=True)  # role id
-    owner_id = fields.CharField(max_length=22)  # owner id
+    role_id = fields.BigIntField(pk=True, generated=False)  # role id
+    owner_id = fields.BigIntField()  # owner id
 
     class Meta:
         unique_together = ("role_id", "owner_id")
+        indexes = (("owner_id", "role_id"),)
@@ -0,0 +1,76 @@
+from datetime import date as datetime_date
+from typing import Mapping, NamedTuple
+
+from tortoise import fields
+from tortoise.models import Model
+
+
+class RollupKey(NamedTuple):
+    guild_id: int
+    emoji_id: int
+    used_by: int
+    day: datetime_date
+
+
+# Rows per upsert statement, 5 parameters each stays below SQLite's limit of
+# 999 bound parameters in older versions.
+UPSERT_BATCH_SIZE = 150
+_COLUMNS = ("guild_id", "emoji_id", "used_by", "day", "count")
+
+
+class EmojiUsageDailyModel(Model):
+    guild_id: int = fields.BigIntField()  # guild id
+    emoji_id: int = fields.BigIntField()  # emoji id
+    used_by: int = fields.BigIntField()  # user id
+    day: datetime_date = fields.DateField()
+    count: int = fields.IntField(default=0)
+
+    class Meta:
+        unique_together = ("guild_id", "emoji_id", "used_by", "day")
+        indexes = (("guild_id", "day"),)
+
+    @classmethod
+    async def increment(cls, counts: Mapping[RollupKey, int]) -> None:
+        """
+        Adds `counts` to the rollup. Run it in the same transaction as the
+        insert of the raw rows it was computed from.
+
+        Every row is an upsert that adds to the stored count in the database,
+        so concurrent increments of the same row don't overwrite each other.
+        """
+        if not counts:
+            return
+        connection = cls._meta.db
+        dialect = connection.capabilities.dialect
+        quote = "`" if dialect == "mysql" else '"'
+        table = f"{quote}{cls._meta.db_table}{quote}"
+        columns = ", ".join(f"{quote}{column}{quote}" for column in _COLUMNS)
+        count = f"{quote}count{quote}"
+        if dialect == "mysql":
+            conflict = f"ON DUPLICATE KEY UPDATE {count} = {count} + VALUES({count})"
+        else:
+            keys = ", ".join(f"{quote}{column}{quote}" for column in _COLUMNS[:-1])
+            conflict = (
+                f"ON CONFLICT ({keys}) "
+                f"DO UPDATE SET {count} = {table}.{count} + excluded.{count}"
+            )
+        items = list(counts.items())
+        for start in range(0, len(items), UPSERT_BATCH_SIZE):
+            batch = items[start : start + UPSERT_BATCH_SIZE]
+            values: list = []
+            rows = []
+            for key, n in batch:
+                placeholders = []
+                for value in (*key, n):
+                    values.append(value)
+                    if dialect == "postgres":
+                        placeholders.append(f"${len(values)}")
+                    elif dialect == "mysql":
+                        placeholders.append("%s")
+                    else:
+                        placeholders.append("?")
+                rows.append(f"({', '.join(placeholders)})")
+            await connection.execute_query(
+                f"INSERT INTO {table} ({columns}) VALUES {', '.join(rows)} {conflict}",
+                values,
+            )
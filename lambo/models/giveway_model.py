@@ -3,9 +3,12 @@ from tortoise.models import Model
 
 
 class GiveawayModel(Model):
-    message_id = fields.CharField(max_length=22)  # message id
-    channel_id = fields.CharField(max_length=22)  # channel id
+    message_id = fields.BigIntField(index=True)  # message id
+    channel_id = fields.BigIntField()  # channel id
     ends_at = fields.DatetimeField()
     prize = fields.CharField(max_length=512)
     winners = fields.IntField()
     ended = fields.BooleanField(default=False)
+
+    class Meta:
+        indexes = (("ended", "ends_at"),)
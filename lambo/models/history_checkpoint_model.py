@@ -0,0 +1,14 @@
+from datetime import datetime
+from typing import Optional
+
+from tortoise import fields
+from tortoise.models import Model
+
+
+class HistoryCheckpointModel(Model):
+    channel_id: int = fields.BigIntField(unique=True)  # channel id
+    # Oldest message already imported, the import continues before it.
+    last_message_id: Optional[int] = fields.BigIntField(null=True)  # message id
+    processed: int = fields.IntField(default=0)
+    done: bool = fields.BooleanField(default=False)
+    updated_at: datetime = fields.DatetimeField(auto_now=True)
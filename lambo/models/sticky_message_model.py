@@ -3,6 +3,6 @@ from tortoise.models import Model
 
 
 class StickyMessageModel(Model):
-    channel_id: str = fields.CharField(max_length=22, unique=True)  # channel id
-    bot_last_message_id: str = fields.CharField(max_length=22)  # message id
+    channel_id: int = fields.BigIntField(unique=True)  # channel id
+    bot_last_message_id: int = fields.BigIntField()  # message id
     message_content: str = fields.TextField()
@@ -1,8 +1,17 @@
+from typing import Optional
+
 from tortoise import fields
 from tortoise.models import Model
 
 
 class UsedEmojiModel(Model):
-    emoji = fields.CharField(max_length=64, index=True)
+    # Rows stored before usages were keyed by id only have the name, until
+    # `emojis backfill-rollup` assigns them to a guild.
+    guild_id: Optional[int] = fields.BigIntField(null=True)  # guild id
+    emoji_id: Optional[int] = fields.BigIntField(null=True)  # emoji id
+    emoji = fields.CharField(max_length=64)
     timestamp = fields.DatetimeField(auto_now_add=True)
-    used_by = fields.CharField(max_length=22)  # user id
+    used_by = fields.BigIntField()  # user id
+
+    class Meta:
+        indexes = (("guild_id", "emoji_id", "timestamp"), ("emoji", "timestamp"))
@@ -0,0 +1,245 @@
+import asyncio
+import contextvars
+import logging
+from datetime import timedelta
+from typing import Awaitable, Callable, Iterable, Iterator, Optional
+
+import discord
+from tortoise import timezone
+
+from lambo.models.bulk_job_model import BulkJobModel
+
+logger = logging.getLogger(__name__)
+
+# Interrupted jobs are only resumed when their checkpoint is this recent,
+# after that the members they were started for may have changed.
+RESUME_WINDOW = timedelta(hours=1)
+
+MemberAction = Callable[[discord.Member], Awaitable[None]]
+ProgressCallback = Callable[["BulkMemberExecutor"], Awaitable[None]]
+
+# Rate limit responses received by the bulk worker that is currently running.
+_rate_limits: contextvars.ContextVar[Optional[list[int]]] = contextvars.ContextVar(
+    "rate_limits", default=None
+)
+
+
+class RateLimitCounter(logging.Filter):
+    """
+    discord.py retries 429 responses itself and only logs a warning about
+    them. Counts those warnings for the bulk worker that caused them.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno == logging.WARNING and str(record.msg).startswith(
+            "We are being rate limited"
+        ):
+            hits = _rate_limits.get()
+            if hits is not None:
+                hits[0] += 1
+        return True
+
+
+def install_rate_limit_counter(name: str = "discord.http") -> None:
+    http_logger = logging.getLogger(name)
+    if not any(isinstance(f, RateLimitCounter) for f in http_logger.filters):
+        http_logger.addFilter(RateLimitCounter())
+
+
+class BulkMemberExecutor:
+    """
+    Applies `action` to many members of a guild, for example adding or
+    removing a role.
+
+    Runs up to `concurrency` actions at once and adapts that limit to the
+    rate limits Discord reports: it halves on every 429 response and grows
+    by one after as many clean runs as the current limit, up to
+    `max_concurrency`. Progress is stored every `checkpoint_every` members
+    under `key`, so an interrupted job with the same key resumes where it
+    stopped if it made progress within `resume_window`. Members are
+    processed in id order.
+    """
+
+    key: str
+    guild: discord.Guild
+    member_ids: list[int]
+    concurrency: int
+    max_concurrency: int
+    processed: int
+    failures: dict[int, str]
+    rate_limited: int
+
+    def __init__(
+        self,
+        key: str,
+        guild: discord.Guild,
+        member_ids: Iterable[int],
+        action: MemberAction,
+        *,
+        concurrency: int = 4,
+        max_concurrency: int = 10,
+        checkpoint_every: int = 50,
+        resume_window: timedelta = RESUME_WINDOW,
+    ) -> None:
+        if not 1 <= concurrency <= max_concurrency:
+            raise ValueError("concurrency must be between 1 and max_concurrency")
+        self.key = key
+        self.guild = guild
+        self.member_ids = sorted(member_ids)
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.checkpoint_every = checkpoint_every
+        self.resume_window = resume_window
+        self.processed = 0
+        self.failures = {}
+        self.rate_limited = 0
+        self._action = action
+        # Members finished by an earlier, interrupted run with the same key.
+        self._base = 0
+        self._active = 0
+        self._clean_runs = 0
+        self._slots = asyncio.Condition()
+        install_rate_limit_counter()
+
+    @property
+    def total(self) -> int:
+        return self._base + len(self.member_ids)
+
+    def summary(self) -> str:
+        return (
+            f"{self.processed}/{self.total} members, "
+            f"{len(self.failures)} failed, {self.concurrency} at a time"
+        )
+
+    def failure_report(self) -> str:
+        lines = []
+        for member_id, error in sorted(self.failures.items()):
+            member = self.guild.get_member(member_id)
+            name = str(member) if member is not None else "unknown member"
+            lines.append(f"{name} ({member_id}): {error}")
+        return "\n".join(lines)
+
+    @staticmethod
+    async def reset(key: str) -> int:
+        return await BulkJobModel.filter(key=key).delete()
+
+    async def run(
+        self, progress: Optional[ProgressCallback] = None, interval: float = 10
+    ) -> None:
+        checkpoint, _ = await BulkJobModel.get_or_create(
+            key=self.key, defaults={"guild_id": self.guild.id}
+        )
+        if (
+            not checkpoint.done
+            and checkpoint.last_member_id is not None
+            and checkpoint.updated_at >= timezone.now() - self.resume_window
+        ):
+            last_member_id = checkpoint.last_member_id
+            self.member_ids = [i for i in self.member_ids if i > last_member_id]
+            self._base = checkpoint.processed
+            self.failures = {
+                int(member_id): error
+                for member_id, error in checkpoint.failures.items()
+            }
+        else:
+            # A finished or stale job with the same key is run again from
+            # the start.
+            self._base = 0
+            self.failures = {}
+        self.processed = self._base
+        # Runs finish out of order, the checkpoint only moves past members
+        # whose runs and those of everyone before them are finished.
+        finished = [False] * len(self.member_ids)
+        position = 0
+        since_checkpoint = 0
+        save_lock = asyncio.Lock()
+
+        async def save(done: bool = False) -> None:
+            async with save_lock:
+                if position:
+                    checkpoint.last_member_id = self.member_ids[position - 1]
+                checkpoint.processed = self._base + position
+                # Members after the checkpoint are retried when resuming.
+                last_member_id = checkpoint.last_member_id
+                checkpoint.failures = {
+                    str(member_id): error
+                    for member_id, error in self.failures.items()
+                    if done
+                    or (last_member_id is not None and member_id <= last_member_id)
+                }
+                checkpoint.done = done
+                await checkpoint.save()
+
+        items: Iterator[tuple[int, int]] = iter(enumerate(self.member_ids))
+
+        async def worker() -> None:
+            nonlocal position, since_checkpoint
+            hits = [0]
+            _rate_limits.set(hits)
+            for index, member_id in items:
+                await self._acquire()
+                try:
+                    error = await self._apply(member_id)
+                finally:
+                    await self._release(rate_limited=hits[0] > 0)
+                    self.rate_limited += hits[0]
+                    hits[0] = 0
+                if error is not None:
+                    self.failures[member_id] = error
+                self.processed += 1
+                finished[index] = True
+                while position < len(finished) and finished[position]:
+                    position += 1
+                since_checkpoint += 1
+                if since_checkpoint >= self.checkpoint_every:
+                    since_checkpoint = 0
+                    await save()
+
+        reporter: Optional[asyncio.Task] = None
+        if progress is not None:
+
+            async def report_progress() -> None:
+                while True:
+                    await asyncio.sleep(interval)
+                    await progress(self)
+
+            reporter = asyncio.create_task(report_progress())
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.max_concurrency)))
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+            await save(done=position == len(finished))
+
+    async def _apply(self, member_id: int) -> Optional[str]:
+        member = self.guild.get_member(member_id)
+        if member is None:
+            return "Not a member anymore"
+        try:
+            await self._action(member)
+        except discord.HTTPException as e:
+            return str(e)
+        except Exception as e:
+            # Recorded like any other failure instead of stopping one worker
+            # while the others carry on past it.
+            logger.exception("Bulk action on member %s failed", member_id)
+            return f"{type(e).__name__}: {e}"
+        return None
+
+    async def _acquire(self) -> None:
+        async with self._slots:
+            await self._slots.wait_for(lambda: self._active < self.concurrency)
+            self._active += 1
+
+    async def _release(self, rate_limited: bool) -> None:
+        async with self._slots:
+            self._active -= 1
+            if rate_limited:
+                self.concurrency = max(1, self.concurrency // 2)
+                self._clean_runs = 0
+            else:
+                self._clean_runs += 1
+                if self._clean_runs >= self.concurrency:
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+                    self._clean_runs = 0
+            self._slots.notify_all()
@@ -1,74 +1,268 @@
-from collections import namedtuple
+import asyncio
+import functools
+import heapq
+import itertools
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import (
+    Any,
+    Awaitable,
+    Callable,
     Generic,
-    ItemsView,
-    Iterable,
+    Hashable,
     Iterator,
-    KeysView,
     MutableMapping,
-    NamedTuple,
+    Optional,
+    Protocol,
     TypeVar,
     Union,
 )
 
 K = TypeVar("K")
 V = TypeVar("V")
+R = TypeVar("R", covariant=True)
 
 
-@dataclass
-class TTLValue(Generic[V]):
-    expires_at: datetime
+class TTLEntry(Generic[V]):
+    __slots__ = ("value", "expires_at", "seq")
+
     value: V
+    expires_at: float
+    seq: int
+
+    def __init__(self, value: V, expires_at: float, seq: int) -> None:
+        self.value = value
+        self.expires_at = expires_at
+        self.seq = seq
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class TTLCache(MutableMapping[K, V]):
+    """
+    Mapping whose entries expire `expiration_time` after being set.
 
+    Expiry uses `time.monotonic()` and a min-heap of deadlines, so expired
+    entries are dropped in O(log n) each instead of rescanning the whole
+    cache. With `max_size` set, the least recently used entry is evicted
+    once the cache is full.
+    """
 
-class TTLCache(MutableMapping[K, V], Iterable[K]):
-    _inner_cache: MutableMapping[K, TTLValue]
     expiration_time: timedelta
+    max_size: Optional[int]
+    stats: CacheStats
 
-    def __init__(self, expiration_time: Union[int, timedelta] = 60) -> None:
+    _entries: "OrderedDict[K, TTLEntry[V]]"
+    _expiry: list[tuple[float, int, K]]
+
+    def __init__(
+        self,
+        expiration_time: Union[int, float, timedelta] = 60,
+        max_size: Optional[int] = None,
+        *,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
         super().__init__()
-        if isinstance(expiration_time, int):
+        if not isinstance(expiration_time, timedelta):
             expiration_time = timedelta(seconds=expiration_time)
-        else:
-            self.expiration_time = expiration_time
-        self._inner_cache = {}
+        if max_size is not None and max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.expiration_time = expiration_time
+        self.max_size = max_size
+        self.stats = CacheStats()
+        self._ttl = expiration_time.total_seconds()
+        self._timer = timer
+        self._entries = OrderedDict()
+        self._expiry = []
+        self._seq = itertools.count()
 
-    def __contains__(self, k: K) -> bool:
-        self.prune_expired()
-        return k in self._inner_cache
+    def _live_entry(self, k: K, now: float) -> Optional[TTLEntry[V]]:
+        entry = self._entries.get(k)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            del self._entries[k]
+            self.stats.expirations += 1
+            return None
+        return entry
+
+    def __contains__(self, k: object) -> bool:
+        return self._live_entry(k, self._timer()) is not None  # type: ignore
 
     def __getitem__(self, k: K) -> V:
-        inner = self._inner_cache[k]
-        if inner.expires_at < datetime.now():
-            del self._inner_cache[k]
+        entry = self._live_entry(k, self._timer())
+        if entry is None:
+            self.stats.misses += 1
             raise KeyError(k)
-        return inner.value
+        self.stats.hits += 1
+        if self.max_size is not None:
+            self._entries.move_to_end(k)
+        return entry.value
 
     def __setitem__(self, k: K, v: V) -> None:
-        self._inner_cache[k] = TTLValue(datetime.now() + self.expiration_time, v)
-        self.prune_expired()
+        self.set(k, v)
+
+    def set(self, k: K, v: V, ttl: Optional[float] = None) -> None:
+        now = self._timer()
+        self.prune_expired(now)
+        expires_at = now + (self._ttl if ttl is None else ttl)
+        seq = next(self._seq)
+        self._entries[k] = TTLEntry(v, expires_at, seq)
+        self._entries.move_to_end(k)
+        heapq.heappush(self._expiry, (expires_at, seq, k))
+        if self.max_size is not None:
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+        # Overwritten and evicted keys leave stale deadlines behind.
+        if len(self._expiry) > 2 * len(self._entries) + 64:
+            self._expiry = [
+                (entry.expires_at, entry.seq, key)
+                for key, entry in self._entries.items()
+            ]
+            heapq.heapify(self._expiry)
 
     def __delitem__(self, k: K) -> None:
-        del self._inner_cache[k]
+        del self._entries[k]
 
     def get_expiration(self, k: K) -> datetime:
-        return self._inner_cache[k].expires_at
+        remaining = self._entries[k].expires_at - self._timer()
+        return datetime.now() + timedelta(seconds=remaining)
+
+    def prune_expired(self, now: Optional[float] = None) -> None:
+        if now is None:
+            now = self._timer()
+        expiry = self._expiry
+        while expiry and expiry[0][0] <= now:
+            _, seq, k = heapq.heappop(expiry)
+            entry = self._entries.get(k)
+            if entry is not None and entry.seq == seq:
+                del self._entries[k]
+                self.stats.expirations += 1
 
-    def prune_expired(self) -> None:
-        for k in list(self.keys()):
-            if self._inner_cache[k].expires_at < datetime.now():
-                del self[k]
+    def clear(self) -> None:
+        self._entries.clear()
+        self._expiry.clear()
 
     def __len__(self) -> int:
-        return len(self._inner_cache)
+        self.prune_expired()
+        return len(self._entries)
 
     def __iter__(self) -> Iterator[K]:
-        return iter(self._inner_cache)
+        self.prune_expired()
+        return iter(list(self._entries))
+
+
+class AsyncCachedFunction(Protocol[R]):
+    cache: TTLCache[Hashable, Any]
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Awaitable[R]:
+        ...
+
+    def invalidate(self, *args: Any, **kwargs: Any) -> None:
+        ...
+
+    def invalidate_key(self, key: Hashable) -> None:
+        ...
+
+    def clear(self) -> None:
+        ...
+
+
+def _default_key(*args: Any, **kwargs: Any) -> Hashable:
+    return (args, frozenset(kwargs.items()))
+
+
+def async_cached(
+    ttl: Union[int, float, timedelta] = 60,
+    key: Callable[..., Hashable] = _default_key,
+    max_size: Optional[int] = None,
+) -> Callable[[Callable[..., Awaitable[R]]], AsyncCachedFunction[R]]:
+    """
+    Caches the results of a coroutine function in a TTLCache.
+
+    `key` receives the same arguments as the function. Concurrent calls
+    with a key that is still being computed wait for that call instead of
+    starting their own, and take over if that call is cancelled. Use
+    `invalidate(*args)` with the same arguments, `invalidate_key(key)` or
+    `clear()` after writes that change the result.
+    """
+
+    def decorator(func: Callable[..., Awaitable[R]]) -> AsyncCachedFunction[R]:
+        cache: TTLCache[Hashable, Any] = TTLCache(ttl, max_size)
+        in_flight: dict[Hashable, asyncio.Future] = {}
+
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> R:
+            cache_key = key(*args, **kwargs)
+            while True:
+                try:
+                    return cache[cache_key]
+                except KeyError:
+                    pass
+                future = in_flight.get(cache_key)
+                if future is None:
+                    break
+                try:
+                    return await asyncio.shield(future)
+                except asyncio.CancelledError:
+                    if not future.cancelled():
+                        raise
+                    # Only the call computing the value was cancelled, one of
+                    # its waiters takes over instead.
+
+            future = asyncio.get_running_loop().create_future()
+            in_flight[cache_key] = future
+            try:
+                result = await func(*args, **kwargs)
+            except BaseException as e:
+                if isinstance(e, asyncio.CancelledError):
+                    if in_flight.get(cache_key) is future:
+                        del in_flight[cache_key]
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    # Waiters get the exception, nobody else has to see it.
+                    future.exception()
+                raise
+            else:
+                # An invalidation while computing means the result may be stale.
+                if in_flight.get(cache_key) is future:
+                    cache[cache_key] = result
+                future.set_result(result)
+                return result
+            finally:
+                if in_flight.get(cache_key) is future:
+                    del in_flight[cache_key]
+
+        def invalidate_key(cache_key: Hashable) -> None:
+            cache.pop(cache_key, None)
+            in_flight.pop(cache_key, None)
+
+        def invalidate(*args: Any, **kwargs: Any) -> None:
+            invalidate_key(key(*args, **kwargs))
+
+        def clear() -> None:
+            cache.clear()
+            in_flight.clear()
 
-    def keys(self) -> KeysView[K]:
-        return self._inner_cache.keys()
+        wrapper.cache = cache  # type: ignore
+        wrapper.invalidate = invalidate  # type: ignore
+        wrapper.invalidate_key = invalidate_key  # type: ignore
+        wrapper.clear = clear  # type: ignore
+        return wrapper  # type: ignore
 
-    def items(self) -> ItemsView[K, TTLValue[V]]:
-        return self._inner_cache.items()
+    return decorator
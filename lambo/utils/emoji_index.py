@@ -0,0 +1,61 @@
+import re
+from typing import Iterable, Optional
+
+import discord
+
+EMOJI_REGEX = re.compile(r"<a?:\w+:(\d+)>")
+
+
+class EmojiIndex:
+    """
+    Per-guild `emoji id -> Emoji` lookup.
+
+    Guilds are indexed lazily on first use and kept current through
+    `update`, which the client calls from `on_guild_emojis_update`.
+    """
+
+    _guilds: dict[int, dict[int, discord.Emoji]]
+
+    def __init__(self) -> None:
+        self._guilds = {}
+
+    def for_guild(self, guild: discord.Guild) -> dict[int, discord.Emoji]:
+        index = self._guilds.get(guild.id)
+        if index is None:
+            index = {emoji.id: emoji for emoji in guild.emojis}
+            self._guilds[guild.id] = index
+        return index
+
+    def get(self, guild: discord.Guild, emoji_id: int) -> Optional[discord.Emoji]:
+        return self.for_guild(guild).get(emoji_id)
+
+    def find(self, guild: discord.Guild, content: str) -> set[discord.Emoji]:
+        if "<" not in content:
+            return set()
+        ids = EMOJI_REGEX.findall(content)
+        if not ids:
+            return set()
+        index = self.for_guild(guild)
+        return {
+            emoji for emoji_id in ids if (emoji := index.get(int(emoji_id))) is not None
+        }
+
+    def update(
+        self,
+        guild: discord.Guild,
+        before: Iterable[discord.Emoji],
+        after: Iterable[discord.Emoji],
+    ) -> None:
+        index = self._guilds.get(guild.id)
+        if index is None:
+            return
+        after = list(after)
+        after_ids = {emoji.id for emoji in after}
+        for emoji in before:
+            if emoji.id not in after_ids:
+                index.pop(emoji.id, None)
+        for emoji in after:
+            index[emoji.id] = emoji
+
+    def discard(self, guild_id: int) -> None:
+        self._guilds.pop(guild_id, None)
@@ -0,0 +1,80 @@
+import csv
+import json
+from tempfile import SpooledTemporaryFile
+from typing import Callable
+
+import discord
+
+EXPORT_FORMATS = ("txt", "csv", "json")
+# Exports stay in memory up to this size and move to a temporary file after.
+SPOOL_SIZE = 1024 * 1024
+
+
+class MemberExport:
+    """
+    Writes lists of members, grouped in titled sections, straight to a
+    spooled temporary file as txt, csv or json, so a large export never
+    exists as one string.
+
+    `format_member` renders a member in txt exports, csv and json always
+    have the id and the name.
+    """
+
+    format: str
+
+    def __init__(
+        self,
+        format: str,
+        format_member: Callable[[discord.abc.User], str] = str,
+    ) -> None:
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {format}")
+        self.format = format
+        self._format_member = format_member
+        self._file = SpooledTemporaryFile(max_size=SPOOL_SIZE, mode="w+b")
+        self._sections = 0
+        self._members = 0
+        self._csv = csv.writer(self) if format == "csv" else None
+        if self._csv is not None:
+            self._csv.writerow(("section", "id", "name"))
+        elif format == "json":
+            self.write('{"sections": [')
+        self._title = ""
+
+    def write(self, text: str) -> None:
+        self._file.write(text.encode("utf-8"))
+
+    def section(self, title: str, count: int) -> None:
+        self._title = title
+        if self.format == "txt":
+            self.write(
+                f"\n{title}: {count}\n" if self._sections else f"{title}: {count}\n"
+            )
+        elif self.format == "json":
+            self.write("]}, " if self._sections else "")
+            self.write(
+                f'{{"title": {json.dumps(title)}, "count": {count}, "members": ['
+            )
+        self._sections += 1
+        self._members = 0
+
+    def member(self, member: discord.abc.User) -> None:
+        if self._csv is not None:
+            self._csv.writerow((self._title, member.id, str(member)))
+        elif self.format == "json":
+            item = json.dumps({"id": str(member.id), "name": str(member)})
+            self.write(f", {item}" if self._members else item)
+        else:
+            self.write(f"\t{self._format_member(member)}\n")
+        self._members += 1
+
+    def to_file(self, name: str) -> discord.File:
+        """
+        Finishes the export as an attachment named `name` plus the extension.
+        """
+        if self.format == "json":
+            self.write("]}]}\n" if self._sections else "]}\n")
+        self._file.seek(0)
+        # SpooledTemporaryFile only subclasses IOBase from Python 3.11 on,
+        # discord.File needs the BytesIO or temporary file it wraps.
+        return discord.File(self._file._file, filename=f"{name}.{self.format}")  # type: ignore
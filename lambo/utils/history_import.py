@@ -0,0 +1,129 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, Optional
+
+import discord
+from tortoise.transactions import in_transaction
+
+from lambo.models.history_checkpoint_model import HistoryCheckpointModel
+
+logger = logging.getLogger(__name__)
+
+BatchHandler = Callable[[list[discord.Message]], Awaitable[None]]
+
+
+@dataclass
+class ChannelProgress:
+    channel: discord.TextChannel
+    processed: int = 0
+    done: bool = False
+    error: Optional[str] = None
+
+
+class HistoryImporter:
+    """
+    Walks the history of several channels concurrently, newest to oldest,
+    and hands messages to `handle_batch` in chunks of `batch_size`.
+
+    Every batch is stored in the same transaction as the channel's
+    checkpoint, so an interrupted import resumes after the last stored
+    batch without processing any message twice.
+    """
+
+    concurrency: int
+    batch_size: int
+    progress: dict[int, ChannelProgress]
+
+    def __init__(
+        self,
+        channels: Iterable[discord.TextChannel],
+        handle_batch: BatchHandler,
+        *,
+        concurrency: int = 4,
+        batch_size: int = 1000,
+        before: Optional[discord.abc.Snowflake] = None,
+    ) -> None:
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.progress = {channel.id: ChannelProgress(channel) for channel in channels}
+        self._handle_batch = handle_batch
+        self._before = before
+
+    @property
+    def processed(self) -> int:
+        return sum(progress.processed for progress in self.progress.values())
+
+    @property
+    def finished(self) -> int:
+        return sum(
+            1
+            for progress in self.progress.values()
+            if progress.done or progress.error is not None
+        )
+
+    @staticmethod
+    async def reset(channel_ids: Iterable[int]) -> int:
+        return await HistoryCheckpointModel.filter(
+            channel_id__in=list(channel_ids)
+        ).delete()
+
+    async def run(self) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(
+            *(
+                self._import_channel(progress, semaphore)
+                for progress in self.progress.values()
+            )
+        )
+
+    async def _import_channel(
+        self, progress: ChannelProgress, semaphore: asyncio.Semaphore
+    ) -> None:
+        async with semaphore:
+            try:
+                await self._import_history(progress)
+            except discord.HTTPException as e:
+                progress.error = str(e)
+            except Exception as e:
+                # A failed batch is not checkpointed, resuming retries it.
+                logger.exception("Importing history of %s failed", progress.channel)
+                progress.error = f"{type(e).__name__}: {e}"
+
+    async def _import_history(self, progress: ChannelProgress) -> None:
+        checkpoint, _ = await HistoryCheckpointModel.get_or_create(
+            channel_id=progress.channel.id
+        )
+        progress.processed = checkpoint.processed
+        if checkpoint.done:
+            progress.done = True
+            return
+        before = self._before
+        if checkpoint.last_message_id is not None:
+            before = discord.Object(id=checkpoint.last_message_id)
+        batch: list[discord.Message] = []
+        async for message in progress.channel.history(limit=None, before=before):
+            batch.append(message)
+            if len(batch) >= self.batch_size:
+                await self._commit(checkpoint, progress, batch)
+                batch = []
+        await self._commit(checkpoint, progress, batch, done=True)
+
+    async def _commit(
+        self,
+        checkpoint: HistoryCheckpointModel,
+        progress: ChannelProgress,
+        batch: list[discord.Message],
+        done: bool = False,
+    ) -> None:
+        async with in_transaction():
+            if batch:
+                await self._handle_batch(batch)
+                checkpoint.last_message_id = batch[-1].id
+                checkpoint.processed += len(batch)
+            checkpoint.done = done
+            await checkpoint.save()
+        progress.processed = checkpoint.processed
+        progress.done = done
@@ -0,0 +1,317 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterable, Iterator, Optional, Sequence
+
+from tortoise import connections
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+
+QUERY_METHODS = (
+    "execute_insert",
+    "execute_query",
+    "execute_query_dict",
+    "execute_many",
+    "execute_script",
+)
+
+# Queries run by the handler that is currently being tracked.
+_query_count: contextvars.ContextVar[Optional[list[int]]] = contextvars.ContextVar(
+    "query_count", default=None
+)
+# Set while a counted statement runs, some clients implement one execute
+# method with another and it still is a single statement.
+_in_query: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "in_query", default=False
+)
+_query_listeners: list[Callable[[], None]] = []
+
+
+class Histogram:
+    """
+    Cumulative histogram in the Prometheus sense: `counts[i]` holds the
+    observations up to and including `buckets[i]`, the last one all of them.
+    """
+
+    buckets: tuple[float, ...]
+    counts: list[int]
+    count: int
+    sum: float
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> list[int]:
+        total = 0
+        result = []
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates the `q` quantile by interpolating inside its bucket, like
+        Prometheus' histogram_quantile.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        lower = 0.0
+        seen = 0
+        for upper, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return self.buckets[-1]
+
+    @property
+    def average(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+@dataclass
+class HandlerMetrics:
+    duration: Histogram = field(default_factory=lambda: Histogram(DURATION_BUCKETS))
+    queries: Histogram = field(default_factory=lambda: Histogram(QUERY_BUCKETS))
+    errors: int = 0
+
+
+def add_query_listener(listener: Callable[[], None]) -> None:
+    """
+    Calls `listener` for every statement counted by `install_query_counter`.
+    """
+    _query_listeners.append(listener)
+
+
+def _count_queries(
+    method: Callable[..., Awaitable[Any]]
+) -> Callable[..., Awaitable[Any]]:
+    @functools.wraps(method)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        if _in_query.get():
+            return await method(*args, **kwargs)
+        count = _query_count.get()
+        if count is not None:
+            count[0] += 1
+        for listener in _query_listeners:
+            listener()
+        token = _in_query.set(True)
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            _in_query.reset(token)
+
+    wrapper.counts_queries = True  # type: ignore
+    return wrapper
+
+
+def _client_classes(client_class: type) -> Iterator[type]:
+    # The class, the clients it inherits execute methods from and the
+    # transaction wrappers that subclass it.
+    yield from (c for c in client_class.__mro__ if issubclass(c, BaseDBAsyncClient))
+    pending = list(client_class.__subclasses__())
+    while pending:
+        subclass = pending.pop()
+        yield subclass
+        pending.extend(subclass.__subclasses__())
+
+
+def install_query_counter(
+    clients: Optional[Iterable[BaseDBAsyncClient]] = None,
+) -> None:
+    """
+    Counts the statements run through the execute methods of `clients`
+    (all configured connections by default) and their transactions for the
+    tracked handler. Call it after `Tortoise.init`, it patches the client
+    classes and is safe to call again.
+    """
+    if clients is None:
+        clients = connections.all()
+    for client in clients:
+        for client_class in _client_classes(type(client)):
+            for name in QUERY_METHODS:
+                method = client_class.__dict__.get(name)
+                if method is not None and not getattr(method, "counts_queries", False):
+                    setattr(client_class, name, _count_queries(method))
+
+
+class Metrics:
+    """
+    Durations, errors and database queries of event handlers and commands,
+    keyed by kind ("listener", "command") and handler name.
+    """
+
+    handlers: dict[tuple[str, str], HandlerMetrics]
+
+    def __init__(self) -> None:
+        self.handlers = {}
+
+    def get(self, kind: str, name: str) -> HandlerMetrics:
+        metrics = self.handlers.get((kind, name))
+        if metrics is None:
+            metrics = self.handlers[(kind, name)] = HandlerMetrics()
+        return metrics
+
+    def reset(self) -> None:
+        self.handlers.clear()
+
+    @contextmanager
+    def track(self, kind: str, name: str) -> Iterator[HandlerMetrics]:
+        metrics = self.get(kind, name)
+        queries = [0]
+        token = _query_count.set(queries)
+        start = time.perf_counter()
+        try:
+            yield metrics
+        except asyncio.CancelledError:
+            raise
+        except BaseException:
+            metrics.errors += 1
+            raise
+        finally:
+            metrics.duration.observe(time.perf_counter() - start)
+            metrics.queries.observe(queries[0])
+            _query_count.reset(token)
+
+    def wrap(
+        self, kind: str, func: Callable[..., Awaitable[Any]]
+    ) -> Callable[..., Awaitable[Any]]:
+        name = getattr(func, "__qualname__", repr(func))
+
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with self.track(kind, name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    def render_prometheus(self) -> str:
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        duration = "lambo_handler_duration_seconds"
+        queries = "lambo_handler_queries"
+        errors = "lambo_handler_errors_total"
+        lines = [
+            f"# HELP {duration} Time spent in event handlers and commands.",
+            f"# TYPE {duration} histogram",
+        ]
+        items = sorted(self.handlers.items())
+        for (kind, name), metrics in items:
+            lines.extend(_histogram_lines(duration, kind, name, metrics.duration))
+        lines.append(f"# HELP {queries} Database queries per handler run.")
+        lines.append(f"# TYPE {queries} histogram")
+        for (kind, name), metrics in items:
+            lines.extend(_histogram_lines(queries, kind, name, metrics.queries))
+        lines.append(f"# HELP {errors} Handler runs that raised.")
+        lines.append(f"# TYPE {errors} counter")
+        for (kind, name), metrics in items:
+            lines.append(f"{errors}{{{_labels(kind, name)}}} {metrics.errors}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(kind: str, name: str) -> str:
+    return f'kind="{_escape(kind)}",handler="{_escape(name)}"'
+
+
+def _histogram_lines(
+    metric: str, kind: str, name: str, histogram: Histogram
+) -> Iterator[str]:
+    labels = _labels(kind, name)
+    bounds = [f"{bucket:g}" for bucket in histogram.buckets] + ["+Inf"]
+    for bound, count in zip(bounds, histogram.cumulative()):
+        yield f'{metric}_bucket{{{labels},le="{bound}"}} {count}'
+    yield f"{metric}_sum{{{labels}}} {histogram.sum:g}"
+    yield f"{metric}_count{{{labels}}} {histogram.count}"
+
+
+class MetricsServer:
+    """
+    Serves `Metrics.render_prometheus()` over plain HTTP on /metrics.
+    """
+
+    def __init__(self, metrics: Metrics, host: str, port: int) -> None:
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info("Serving metrics on http://%s:%s/metrics", self.host, self.port)
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            # Headers are not needed, but have to be read before answering.
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (
+                b"\r\n",
+                b"\n",
+                b"",
+            ):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1] == "/metrics":
+                status = "200 OK"
+                body = self.metrics.render_prometheus().encode()
+            else:
+                status = "404 Not Found"
+                body = b"Not found\n"
+            head = (
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n"
+            )
+            writer.write(head.encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType, FrameType
+from typing import Optional
+
+
+def _code_label(code: CodeType) -> str:
+    # Collapsed stacks separate frames with ";", which paths never contain.
+    path = os.path.join(*code.co_filename.replace("\\", "/").split("/")[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread from a background thread every
+    `interval` seconds and counts identical stacks. It never touches the
+    profiled thread, so the overhead stays with the sampler.
+    """
+
+    interval: float
+    samples: Counter[tuple[CodeType, ...]]
+
+    def __init__(self, thread_id: int, interval: float = 0.005) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            raise RuntimeError("The profiler is already running")
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="lambo-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame: Optional[FrameType] = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            # Stored as code objects, turning them into text waits for the end.
+            self.samples[tuple(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """
+        The samples in the collapsed stack format read by flamegraph.pl and
+        speedscope: one "root;...;leaf count" line per distinct stack.
+        """
+        labels: dict[CodeType, str] = {}
+        lines = []
+        for stack, count in self.samples.most_common():
+            for code in stack:
+                if code not in labels:
+                    labels[code] = _code_label(code)
+            frames = ";".join(labels[code] for code in stack)
+            lines.append(f"{frames} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class SlowCallbackRecorder(logging.Handler):
+    """
+    Puts the loop in debug mode, which makes asyncio log every callback
+    that runs longer than `threshold` seconds, and collects those warnings.
+    """
+
+    entries: list[str]
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold: float) -> None:
+        super().__init__(logging.WARNING)
+        self.loop = loop
+        self.threshold = threshold
+        self.entries = []
+        self._previous: Optional[tuple[bool, float]] = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.getMessage().startswith("Executing "):
+            timestamp = time.strftime("%H:%M:%S", time.localtime(record.created))
+            self.entries.append(f"{timestamp} {record.getMessage()}")
+
+    def start(self) -> None:
+        self._previous = (self.loop.get_debug(), self.loop.slow_callback_duration)
+        self.loop.slow_callback_duration = self.threshold
+        self.loop.set_debug(True)
+        logging.getLogger("asyncio").addHandler(self)
+
+    def stop(self) -> None:
+        logging.getLogger("asyncio").removeHandler(self)
+        if self._previous is not None:
+            debug, self.loop.slow_callback_duration = self._previous
+            self.loop.set_debug(debug)
+            self._previous = None
+
+
+class ProfileSession:
+    """
+    Samples the event loop thread and records slow callbacks until stopped.
+    Create, start and stop it from the event loop.
+    """
+
+    started_at: float
+    duration: float
+
+    def __init__(
+        self, interval: float = 0.005, slow_callback_threshold: float = 0.1
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        self.sampler = SamplingProfiler(threading.get_ident(), interval)
+        self.slow_callbacks = SlowCallbackRecorder(loop, slow_callback_threshold)
+        self.started_at = time.monotonic()
+        self.duration = 0.0
+
+    def start(self) -> None:
+        self.started_at = time.monotonic()
+        self.slow_callbacks.start()
+        self.sampler.start()
+
+    def stop(self) -> None:
+        self.sampler.stop()
+        self.slow_callbacks.stop()
+        self.duration = time.monotonic() - self.started_at
+
+    @property
+    def sample_count(self) -> int:
+        return sum(self.sampler.samples.values())
+
+    def top_functions(self, limit: int = 10) -> list[tuple[str, int]]:
+        """
+        Functions by the number of samples they were running in (leaf frame).
+        """
+        leaves: Counter[CodeType] = Counter()
+        for stack, count in self.sampler.samples.items():
+            if stack:
+                leaves[stack[-1]] += count
+        return [(_code_label(code), count) for code, count in leaves.most_common(limit)]
@@ -0,0 +1,91 @@
+from typing import AbstractSet, Iterable
+
+import discord
+
+
+class RoleIndex:
+    """
+    Per-guild `role id -> member ids` lookup.
+
+    `Role.members` scans every member of the guild on each access; this
+    index is built with one scan per guild and kept current through the
+    member and role events the client forwards to it. Guilds are only kept
+    once they are chunked, before that the member cache is incomplete and
+    the index is rebuilt on every use.
+    """
+
+    _guilds: dict[int, dict[int, set[int]]]
+
+    def __init__(self) -> None:
+        self._guilds = {}
+
+    def for_guild(self, guild: discord.Guild) -> dict[int, set[int]]:
+        index = self._guilds.get(guild.id)
+        if index is None:
+            index = {}
+            for member in guild.members:
+                for role_id in member._roles:
+                    index.setdefault(role_id, set()).add(member.id)
+            if guild.chunked:
+                self._guilds[guild.id] = index
+        return index
+
+    def member_ids(self, role: discord.Role) -> AbstractSet[int]:
+        """
+        Ids of the members with `role`. The set is live, copy it before
+        awaiting if it has to stay the same.
+        """
+        if role.is_default():
+            return {member.id for member in role.guild.members}
+        return self.for_guild(role.guild).get(role.id, set())
+
+    def members(
+        self, guild: discord.Guild, member_ids: Iterable[int]
+    ) -> list[discord.Member]:
+        """
+        The cached members for `member_ids`, in id order.
+        """
+        return [
+            member
+            for member_id in sorted(member_ids)
+            if (member := guild.get_member(member_id)) is not None
+        ]
+
+    def add_member(self, member: discord.Member) -> None:
+        index = self._guilds.get(member.guild.id)
+        if index is None:
+            return
+        for role_id in member._roles:
+            index.setdefault(role_id, set()).add(member.id)
+
+    def remove_member(self, member: discord.Member) -> None:
+        index = self._guilds.get(member.guild.id)
+        if index is None:
+            return
+        for role_id in member._roles:
+            member_ids = index.get(role_id)
+            if member_ids is not None:
+                member_ids.discard(member.id)
+
+    def update_member(self, before: discord.Member, after: discord.Member) -> None:
+        index = self._guilds.get(after.guild.id)
+        if index is None:
+            return
+        before_roles = set(before._roles)
+        after_roles = set(after._roles)
+        if before_roles == after_roles:
+            return
+        for role_id in before_roles - after_roles:
+            member_ids = index.get(role_id)
+            if member_ids is not None:
+                member_ids.discard(after.id)
+        for role_id in after_roles - before_roles:
+            index.setdefault(role_id, set()).add(after.id)
+
+    def remove_role(self, role: discord.Role) -> None:
+        index = self._guilds.get(role.guild.id)
+        if index is not None:
+            index.pop(role.id, None)
+
+    def discard(self, guild_id: int) -> None:
+        self._guilds.pop(guild_id, None)
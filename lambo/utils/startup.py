@@ -0,0 +1,44 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+logger = logging.getLogger("lambo.startup")
+
+
+class StartupProfiler:
+    """
+    Logs how long each startup phase takes and how long it has been since
+    the process started.
+    """
+
+    started_at: float
+    phases: list[tuple[str, float]]
+
+    def __init__(self) -> None:
+        self.started_at = time.perf_counter()
+        self.phases = []
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.phases.append((name, duration))
+            logger.info(
+                "%s took %.1f ms (%.1f ms since start)",
+                name,
+                duration * 1000,
+                self.elapsed * 1000,
+            )
+
+    def mark(self, name: str) -> None:
+        elapsed = self.elapsed
+        self.phases.append((name, elapsed))
+        logger.info("%s after %.1f ms", name, elapsed * 1000)
@@ -1,3 +1,4 @@
+import random
 import re
 import typing
 from datetime import date, datetime, timedelta
@@ -6,7 +7,10 @@ import discord
 from discord import Guild, Role
 from discord.ext.commands import Context, Converter, RoleConverter, RoleNotFound
 
-from lambo.custom_client import CustomClient
+if typing.TYPE_CHECKING:
+    from lambo.custom_client import CustomClient
+
+T = typing.TypeVar("T")
 
 
 class FuzzyRoleConverter(RoleConverter):
@@ -76,7 +80,7 @@ def is_member(user: discord.User | discord.Member) -> typing.TypeGuard[discord.M
     return isinstance(user, discord.Member)
 
 
-def get_text_channel(bot: CustomClient, channel_id: int) -> discord.TextChannel:
+def get_text_channel(bot: "CustomClient", channel_id: int) -> discord.TextChannel:
     channel = bot.get_channel(channel_id)
     if not channel:
         raise ValueError(f"Channel with id {channel_id} not found.")
@@ -85,7 +89,7 @@ def get_text_channel(bot: CustomClient, channel_id: int) -> discord.TextChannel:
     return channel  # type: ignore
 
 
-def get_guild(bot: CustomClient, guild_id: int) -> discord.Guild:
+def get_guild(bot: "CustomClient", guild_id: int) -> discord.Guild:
     guild = bot.get_guild(guild_id)
     if not guild:
         raise ValueError(f"Guild with id {guild_id} not found.")
@@ -107,10 +111,17 @@ def unwrap_channels(
         discord.VoiceChannel,
         discord.CategoryChannel,
         discord.StageChannel,
+        discord.ForumChannel,
     ]
 ]:
     if isinstance(
-        channel, (discord.TextChannel, discord.VoiceChannel, discord.StageChannel)
+        channel,
+        (
+            discord.TextChannel,
+            discord.VoiceChannel,
+            discord.StageChannel,
+            discord.ForumChannel,
+        ),
     ):
         return [channel]
     if isinstance(channel, discord.CategoryChannel):
@@ -140,3 +151,28 @@ def replace_values(string: str, **kwargs: typing.Callable[[str], str]) -> str:
         return kwargs[key](value)
 
     return REPLACE_REGEX.sub(replacer, string)
+
+
+async def reservoir_sample(
+    iterable: typing.AsyncIterable[T],
+    k: int,
+    predicate: typing.Optional[typing.Callable[[T], bool]] = None,
+) -> list[T]:
+    """
+    Picks up to `k` random items from `iterable` while it is consumed,
+    keeping only the sample in memory.
+    """
+    reservoir: list[T] = []
+    seen = 0
+    async for item in iterable:
+        if predicate is not None and not predicate(item):
+            continue
+        seen += 1
+        if len(reservoir) < k:
+            reservoir.append(item)
+            continue
+        idx = random.randrange(seen)
+        if idx < k:
+            reservoir[idx] = item
+    random.shuffle(reservoir)
+    return reservoir
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Generic, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BufferStats:
+    flushes: int = 0
+    failed_flushes: int = 0
+    flushed_items: int = 0
+    dropped_items: int = 0
+    max_depth: int = 0
+    last_flush_seconds: float = 0.0
+    max_flush_seconds: float = 0.0
+    total_flush_seconds: float = 0.0
+
+    @property
+    def average_flush_seconds(self) -> float:
+        attempts = self.flushes + self.failed_flushes
+        if attempts == 0:
+            return 0.0
+        return self.total_flush_seconds / attempts
+
+
+class WriteBehindBuffer(Generic[T]):
+    """
+    Collects items in memory and hands them to `flush_callback` in batches,
+    once `max_size` items are queued or `max_delay` seconds after the first
+    queued item, whichever comes first.
+
+    After a failed flush the items are kept and retried with exponential
+    backoff, up to `max_backoff` seconds apart. At most `max_retained`
+    items are kept meanwhile, the oldest are dropped beyond that.
+    """
+
+    max_size: int
+    max_delay: float
+    max_backoff: float
+    max_retained: int
+    stats: BufferStats
+
+    def __init__(
+        self,
+        flush_callback: Callable[[list[T]], Awaitable[Any]],
+        *,
+        max_size: int = 500,
+        max_delay: float = 5.0,
+        max_backoff: float = 300.0,
+        max_retained: int = 100_000,
+    ) -> None:
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        if max_retained < max_size:
+            raise ValueError("max_retained must be at least max_size")
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.max_backoff = max_backoff
+        self.max_retained = max_retained
+        self.stats = BufferStats()
+        self._flush_callback = flush_callback
+        self._items: list[T] = []
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+        self._closed = False
+        # Failed flushes in a row, while there are any only the retry timer
+        # flushes.
+        self._failures = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def depth(self) -> int:
+        return len(self._items)
+
+    def extend(self, items: Iterable[T]) -> None:
+        if self._closed:
+            raise RuntimeError("Buffer is closed")
+        self._items.extend(items)
+        depth = len(self._items)
+        if depth == 0:
+            return
+        self.stats.max_depth = max(self.stats.max_depth, depth)
+        if self._failures:
+            self._drop_excess()
+        elif depth >= self.max_size:
+            self._flush_in_background()
+        elif self._timer is None:
+            self._schedule(self.max_delay)
+
+    def _schedule(self, delay: float) -> None:
+        self._cancel_timer()
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_later(delay, self._flush_in_background)
+
+    def _drop_excess(self) -> None:
+        excess = len(self._items) - self.max_retained
+        if excess > 0:
+            del self._items[:excess]
+            self.stats.dropped_items += excess
+            logger.error("Write-behind buffer is full, dropped %s items", excess)
+
+    def _flush_in_background(self) -> None:
+        self._cancel_timer()
+        task = asyncio.create_task(self._safe_flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _safe_flush(self) -> None:
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Flushing write-behind buffer failed")
+
+    def _cancel_timer(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    async def flush(self) -> None:
+        async with self._lock:
+            self._cancel_timer()
+            if not self._items:
+                return
+            items, self._items = self._items, []
+            start = time.perf_counter()
+            try:
+                await self._flush_callback(items)
+            except Exception:
+                self.stats.failed_flushes += 1
+                self._failures += 1
+                # Keep the rows so the retry includes them.
+                self._items[:0] = items
+                self._drop_excess()
+                if not self._closed:
+                    self._schedule(
+                        min(self.max_delay * 2**self._failures, self.max_backoff)
+                    )
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                self.stats.last_flush_seconds = elapsed
+                self.stats.max_flush_seconds = max(
+                    self.stats.max_flush_seconds, elapsed
+                )
+                self.stats.total_flush_seconds += elapsed
+            self.stats.flushes += 1
+            self.stats.flushed_items += len(items)
+            self._failures = 0
+            # Items queued during the flush or the backoff have no timer yet.
+            if self._items and self._timer is None and not self._closed:
+                self._schedule(self.max_delay)
+
+    async def close(self) -> None:
+        self._closed = True
+        self._cancel_timer()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.flush()
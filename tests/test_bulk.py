@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from datetime import timedelta
+from types import SimpleNamespace
+
+import discord
+from tortoise import Tortoise, timezone
+
+from lambo.models.bulk_job_model import BulkJobModel
+from lambo.utils.bulk import BulkMemberExecutor
+
+
+def make_guild(member_ids):
+    members = {i: SimpleNamespace(id=i) for i in member_ids}
+    return SimpleNamespace(id=1, get_member=members.get)
+
+
+async def with_db(test):
+    await Tortoise.init(
+        db_url="sqlite://:memory:",
+        modules={"models": ["lambo.models.bulk_job_model"]},
+    )
+    await Tortoise.generate_schemas()
+    try:
+        return await test()
+    finally:
+        await Tortoise.close_connections()
+
+
+def test_rate_limits_are_counted_and_failures_reported():
+    http_logger = logging.getLogger("discord.http")
+    applied = []
+
+    async def action(member):
+        await asyncio.sleep(0)
+        if member.id == 5:
+            response = SimpleNamespace(status=403, reason="Forbidden")
+            raise discord.Forbidden(response, "Missing Permissions")  # type: ignore
+        if member.id == 7:
+            raise RuntimeError("boom")
+        if member.id == 20:
+            http_logger.warning("We are being rate limited. Retrying in %.2f", 1.0)
+        applied.append(member.id)
+
+    async def test():
+        executor = BulkMemberExecutor(
+            "test", make_guild(range(40)), range(41), action, concurrency=8
+        )
+        await executor.run()
+        return executor
+
+    executor = asyncio.run(with_db(test))
+    assert sorted(applied) == [i for i in range(40) if i not in (5, 7)]
+    assert executor.processed == executor.total == 41
+    assert set(executor.failures) == {5, 7, 40}
+    assert "403 Forbidden" in executor.failures[5]
+    assert executor.failures[7] == "RuntimeError: boom"
+    assert executor.rate_limited == 1
+    assert 1 <= executor.concurrency <= executor.max_concurrency
+    assert "(40): Not a member anymore" in executor.failure_report()
+
+
+def test_interrupted_job_resumes_after_checkpoint():
+    applied = []
+
+    async def test():
+        blocked = asyncio.Event()
+
+        async def action(member):
+            if member.id == 12 and not blocked.is_set():
+                await blocked.wait()
+            applied.append(member.id)
+
+        guild = make_guild(range(20))
+        first = BulkMemberExecutor(
+            "resume", guild, range(20), action, concurrency=1, checkpoint_every=1
+        )
+        try:
+            await asyncio.wait_for(first.run(), 0.5)
+        except asyncio.TimeoutError:
+            pass
+        blocked.set()
+        applied.clear()
+        second = BulkMemberExecutor("resume", guild, range(20), action)
+        await second.run()
+        return second
+
+    executor = asyncio.run(with_db(test))
+    assert sorted(applied) == list(range(12, 20))
+    assert executor.processed == executor.total == 20
+
+
+def test_stale_checkpoint_starts_over():
+    applied = []
+
+    async def action(member):
+        applied.append(member.id)
+
+    async def test():
+        await BulkJobModel.create(
+            key="stale",
+            guild_id=1,
+            last_member_id=10,
+            processed=11,
+            failures={"3": "x"},
+        )
+        await BulkJobModel.filter(key="stale").update(
+            updated_at=timezone.now() - timedelta(days=2)
+        )
+        executor = BulkMemberExecutor("stale", make_guild(range(20)), range(20), action)
+        await executor.run()
+        return executor
+
+    executor = asyncio.run(with_db(test))
+    assert sorted(applied) == list(range(20))
+    assert executor.processed == executor.total == 20
+    assert executor.failures == {}
+
+
+def test_concurrency_adapts_to_rate_limits():
+    async def test():
+        executor = BulkMemberExecutor(
+            "aimd", make_guild([]), [], None, concurrency=8  # type: ignore
+        )
+        await executor._acquire()
+        await executor._release(rate_limited=True)
+        assert executor.concurrency == 4
+        for _ in range(4):
+            await executor._acquire()
+            await executor._release(rate_limited=False)
+        return executor.concurrency
+
+    assert asyncio.run(test()) == 5
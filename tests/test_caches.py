@@ -0,0 +1,137 @@
+import asyncio
+from datetime import datetime
+
+from lambo.utils.caches import TTLCache, async_cached
+
+
+class FakeTimer:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_entries_expire():
+    timer = FakeTimer()
+    cache: TTLCache[int, str] = TTLCache(10, timer=timer)
+    cache[1] = "a"
+    timer.now = 5
+    cache[2] = "b"
+    assert 1 in cache and cache[1] == "a"
+    timer.now = 10
+    assert 1 not in cache
+    assert cache[2] == "b"
+    assert len(cache) == 1
+    timer.now = 15
+    assert len(cache) == 0
+    assert cache.stats.expirations == 2
+
+
+def test_overwrite_extends_expiration():
+    timer = FakeTimer()
+    cache: TTLCache[int, str] = TTLCache(10, timer=timer)
+    cache[1] = "a"
+    timer.now = 8
+    cache[1] = "b"
+    timer.now = 12
+    assert cache[1] == "b"
+    assert cache.get_expiration(1) > datetime.now()
+
+
+def test_max_size_evicts_least_recently_used():
+    timer = FakeTimer()
+    cache: TTLCache[int, int] = TTLCache(10, max_size=2, timer=timer)
+    cache[1] = 1
+    cache[2] = 2
+    assert cache[1] == 1
+    cache[3] = 3
+    assert list(cache) == [1, 3]
+    assert cache.stats.evictions == 1
+
+
+def test_stats_count_hits_and_misses():
+    cache: TTLCache[int, int] = TTLCache(10)
+    cache[1] = 1
+    assert cache.get(1) == 1
+    assert cache.get(2) is None
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_async_cached_coalesces_concurrent_calls():
+    calls: list[int] = []
+
+    @async_cached(ttl=60)
+    async def lookup(value: int) -> int:
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def run():
+        results = await asyncio.gather(*(lookup(1) for _ in range(5)), lookup(2))
+        assert results == [2, 2, 2, 2, 2, 4]
+        assert await lookup(1) == 2
+
+    asyncio.run(run())
+    assert calls == [1, 2]
+
+
+def test_async_cached_invalidation():
+    calls: list[int] = []
+
+    @async_cached(ttl=60, key=lambda value, label: value)
+    async def lookup(value: int, label: str) -> int:
+        calls.append(value)
+        return value
+
+    async def run():
+        await lookup(1, "a")
+        await lookup(1, "b")
+        lookup.invalidate(1, "c")
+        await lookup(1, "a")
+        lookup.clear()
+        await lookup(1, "a")
+
+    asyncio.run(run())
+    assert calls == [1, 1, 1]
+
+
+def test_async_cached_does_not_cache_errors():
+    calls: list[int] = []
+
+    @async_cached(ttl=60)
+    async def lookup(value: int) -> int:
+        calls.append(value)
+        raise ValueError(value)
+
+    async def run():
+        for _ in range(2):
+            try:
+                await lookup(1)
+            except ValueError:
+                pass
+
+    asyncio.run(run())
+    assert calls == [1, 1]
+
+
+def test_async_cached_waiters_survive_cancelled_owner():
+    calls: list[int] = []
+
+    @async_cached(ttl=60)
+    async def lookup(value: int) -> int:
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def run():
+        owner = asyncio.create_task(lookup(1))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(lookup(1)) for _ in range(3)]
+        await asyncio.sleep(0)
+        owner.cancel()
+        assert await asyncio.gather(*waiters) == [2, 2, 2]
+        assert owner.cancelled()
+
+    asyncio.run(run())
+    assert calls == [1, 1]
@@ -0,0 +1,39 @@
+import asyncio
+from datetime import date
+
+from tortoise import Tortoise
+
+from lambo.models.emoji_usage_rollup_model import EmojiUsageDailyModel, RollupKey
+
+
+def test_concurrent_increments_add_up():
+    day = date(2024, 1, 2)
+
+    async def run():
+        await Tortoise.init(
+            db_url="sqlite://:memory:",
+            modules={"models": ["lambo.models.emoji_usage_rollup_model"]},
+        )
+        await Tortoise.generate_schemas()
+        try:
+            await asyncio.gather(
+                *(
+                    EmojiUsageDailyModel.increment(
+                        {RollupKey(1, 2, 3, day): 1, RollupKey(1, 2, 4, day): 2}
+                    )
+                    for _ in range(10)
+                )
+            )
+            # More rows than fit in one statement.
+            await EmojiUsageDailyModel.increment(
+                {RollupKey(1, 2, user, day): 1 for user in range(3, 400)}
+            )
+            rows = await EmojiUsageDailyModel.filter(used_by__in=[3, 4])
+            total = await EmojiUsageDailyModel.all().count()
+            return {row.used_by: row.count for row in rows}, total
+        finally:
+            await Tortoise.close_connections()
+
+    counts, total = asyncio.run(run())
+    assert counts == {3: 11, 4: 21}
+    assert total == 397
@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+from types import SimpleNamespace
+
+from lambo.utils.export import MemberExport
+
+
+class FakeMember(SimpleNamespace):
+    def __str__(self) -> str:
+        return self.name
+
+
+MEMBERS = [FakeMember(id=1, name="ann"), FakeMember(id=2, name='bo "b"')]
+
+
+def export(format: str) -> str:
+    writer = MemberExport(format, lambda member: f"<{member.id}>")
+    writer.section("👍", 2)
+    for member in MEMBERS:
+        writer.member(member)
+    writer.section("Not reacted", 0)
+    return writer.to_file("reacted").fp.read().decode()
+
+
+def test_txt_export():
+    assert export("txt") == "👍: 2\n\t<1>\n\t<2>\n\nNot reacted: 0\n"
+
+
+def test_csv_export():
+    rows = list(csv.reader(io.StringIO(export("csv"))))
+    assert rows == [
+        ["section", "id", "name"],
+        ["👍", "1", "ann"],
+        ["👍", "2", 'bo "b"'],
+    ]
+
+
+def test_json_export():
+    assert json.loads(export("json")) == {
+        "sections": [
+            {
+                "title": "👍",
+                "count": 2,
+                "members": [{"id": "1", "name": "ann"}, {"id": "2", "name": 'bo "b"'}],
+            },
+            {"title": "Not reacted", "count": 0, "members": []},
+        ]
+    }
+    empty = MemberExport("json")
+    assert json.loads(empty.to_file("empty").fp.read()) == {"sections": []}
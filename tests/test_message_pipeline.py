@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+from lambo.message_pipeline import MessageStage
+
+
+def make_stage(**kwargs) -> MessageStage:
+    options = dict(
+        name="Test.stage",
+        owner="Test",
+        callback=None,
+        guild_ids=frozenset({1}),
+        channel_ids=None,
+        author_ids=None,
+        bots=False,
+        skip_commands=False,
+        guild_only=True,
+    )
+    options.update(kwargs)
+    return MessageStage(**options)  # type: ignore
+
+
+def make_message(guild_id=None) -> SimpleNamespace:
+    guild = SimpleNamespace(id=guild_id) if guild_id is not None else None
+    return SimpleNamespace(
+        guild=guild,
+        channel=SimpleNamespace(id=10),
+        author=SimpleNamespace(id=20, bot=False),
+    )
+
+
+def test_guild_ids_filter_guild_messages_only():
+    guild_only = make_stage()
+    with_dms = make_stage(guild_only=False)
+    assert guild_only.matches(make_message(1))  # type: ignore
+    assert not guild_only.matches(make_message(2))  # type: ignore
+    assert not guild_only.matches(make_message())  # type: ignore
+    assert with_dms.matches(make_message(1))  # type: ignore
+    assert not with_dms.matches(make_message(2))  # type: ignore
+    assert with_dms.matches(make_message())  # type: ignore
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+from tortoise import Tortoise, connections
+from tortoise.transactions import in_transaction
+
+from lambo.utils.metrics import Histogram, Metrics, MetricsServer, install_query_counter
+
+
+def test_histogram_quantile_interpolates_inside_bucket():
+    histogram = Histogram([1, 2, 4])
+    for value in (0.5, 1.5, 1.5, 3, 10):
+        histogram.observe(value)
+    assert histogram.cumulative() == [1, 3, 4, 5]
+    assert histogram.quantile(0.5) == pytest.approx(1.75)
+    assert histogram.quantile(1.0) == 4
+    assert histogram.average == pytest.approx(16.5 / 5)
+
+
+def test_track_counts_errors_and_queries():
+    metrics = Metrics()
+
+    async def handler(fail: bool) -> None:
+        connection = connections.get("default")
+        await connection.execute_query("SELECT 1")
+        async with in_transaction() as transaction:
+            await transaction.execute_query_dict("SELECT 2")
+        if fail:
+            raise ValueError
+
+    wrapped = metrics.wrap("listener", handler)
+
+    async def run():
+        await Tortoise.init(
+            db_url="sqlite://:memory:",
+            modules={"models": ["lambo.models.emoji_usage_rollup_model"]},
+        )
+        try:
+            install_query_counter()
+            install_query_counter()
+            await wrapped(False)
+            with pytest.raises(ValueError):
+                await wrapped(True)
+        finally:
+            await Tortoise.close_connections()
+
+    asyncio.run(run())
+    (key, handler_metrics), *_ = metrics.handlers.items()
+    assert key[0] == "listener" and key[1].endswith("handler")
+    assert handler_metrics.duration.count == 2
+    assert handler_metrics.errors == 1
+    assert handler_metrics.queries.sum == 4
+
+
+def test_server_exposes_prometheus_text():
+    metrics = Metrics()
+    with metrics.track("command", 'say "hi"'):
+        pass
+
+    async def run() -> bytes:
+        server = MetricsServer(metrics, "127.0.0.1", 0)
+        await server.start()
+        port = server._server.sockets[0].getsockname()[1]  # type: ignore
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+        await server.close()
+        return response
+
+    response = asyncio.run(run()).decode()
+    assert response.startswith("HTTP/1.1 200 OK")
+    assert (
+        'lambo_handler_duration_seconds_count{kind="command",handler="say \\"hi\\""} 1'
+        in response
+    )
+    assert (
+        'lambo_handler_errors_total{kind="command",handler="say \\"hi\\""} 0'
+        in response
+    )
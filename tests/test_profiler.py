@@ -0,0 +1,29 @@
+import asyncio
+import time
+
+from lambo.utils.profiler import ProfileSession
+
+
+def busy_wait(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_session_samples_loop_and_records_slow_callbacks():
+    async def run() -> ProfileSession:
+        loop = asyncio.get_running_loop()
+        session = ProfileSession(interval=0.001, slow_callback_threshold=0.05)
+        session.start()
+        loop.call_soon(busy_wait, 0.2)
+        await asyncio.sleep(0.3)
+        session.stop()
+        assert not loop.get_debug()
+        return session
+
+    session = asyncio.run(run())
+    assert session.sample_count > 0
+    assert "busy_wait (tests/test_profiler.py:7)" in session.sampler.collapsed()
+    assert any(label.startswith("busy_wait ") for label, _ in session.top_functions())
+    assert len(session.slow_callbacks.entries) == 1
+    assert "busy_wait" in session.slow_callbacks.entries[0]
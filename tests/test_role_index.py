@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+from lambo.utils.role_index import RoleIndex
+
+
+def make_guild(chunked: bool = True) -> SimpleNamespace:
+    guild = SimpleNamespace(id=1, chunked=chunked, members=[])
+    guild.get_member = lambda member_id: next(
+        (m for m in guild.members if m.id == member_id), None
+    )
+    return guild
+
+
+def make_member(guild: SimpleNamespace, member_id: int, *roles: int):
+    member = SimpleNamespace(id=member_id, guild=guild, _roles=list(roles))
+    guild.members.append(member)
+    return member
+
+
+def make_role(guild: SimpleNamespace, role_id: int) -> SimpleNamespace:
+    return SimpleNamespace(id=role_id, guild=guild, is_default=lambda: False)
+
+
+def test_index_follows_member_events():
+    guild = make_guild()
+    first, second = make_role(guild, 10), make_role(guild, 20)
+    make_member(guild, 1, 10)
+    both = make_member(guild, 2, 10, 20)
+    index = RoleIndex()
+    assert index.member_ids(first) == {1, 2}
+    assert index.member_ids(first) & index.member_ids(second) == {2}
+
+    joined = make_member(guild, 3, 20)
+    index.add_member(joined)
+    assert index.member_ids(second) == {2, 3}
+
+    after = SimpleNamespace(id=2, guild=guild, _roles=[20])
+    index.update_member(both, after)
+    assert index.member_ids(first) == {1}
+
+    index.remove_member(joined)
+    assert index.member_ids(second) == {2}
+    assert [m.id for m in index.members(guild, {2, 1})] == [1, 2]
+
+
+def test_unchunked_guilds_are_not_kept():
+    guild = make_guild(chunked=False)
+    role = make_role(guild, 10)
+    make_member(guild, 1, 10)
+    index = RoleIndex()
+    assert index.member_ids(role) == {1}
+    make_member(guild, 2, 10)
+    assert index.member_ids(role) == {1, 2}
@@ -0,0 +1,41 @@
+import asyncio
+from types import SimpleNamespace
+
+from lambo.cogs.utilities import RoleMembersPaginator
+
+
+def make_guild(names: dict[int, str]) -> SimpleNamespace:
+    return SimpleNamespace(id=1, get_member=names.get)
+
+
+def render(paginator: RoleMembersPaginator, page: int) -> list[str]:
+    content = paginator.get_page_content(paginator.pages[page]).content
+    prefix, text = content.split("\n", 1)
+    assert prefix == "Members"
+    return text.strip("`\n").split("\n")
+
+
+def test_pages_are_rendered_on_demand():
+    async def run():
+        guild = make_guild({i: f"member{i}" for i in range(1, 12) if i != 11})
+        paginator = RoleMembersPaginator(
+            guild, list(range(1, 12)), "Members", per_page=5, with_ids=False  # type: ignore
+        )
+        assert len(paginator.pages) == 3
+        assert render(paginator, 0)[0] == "01. member1"
+        assert render(paginator, 1) == [f"{i:02}. member{i}" for i in range(6, 11)]
+        assert render(paginator, 2) == ["11. (left the server)"]
+
+        with_ids = RoleMembersPaginator(guild, [3], "Members", 5, with_ids=True)  # type: ignore
+        assert render(with_ids, 0) == ["1. 3 member3"]
+
+    asyncio.run(run())
+
+
+def test_empty_role_has_one_empty_page():
+    async def run():
+        paginator = RoleMembersPaginator(make_guild({}), [], "Members", 5, False)  # type: ignore
+        assert len(paginator.pages) == 1
+        assert render(paginator, 0) == [""]
+
+    asyncio.run(run())
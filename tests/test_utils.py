@@ -0,0 +1,28 @@
+import asyncio
+from collections import Counter
+
+from lambo.utils import reservoir_sample
+
+
+async def aiter_range(n: int):
+    for i in range(n):
+        yield i
+
+
+def test_reservoir_sample_size_and_filter():
+    sample = asyncio.run(reservoir_sample(aiter_range(1000), 10, lambda i: i % 2 == 0))
+    assert len(sample) == 10
+    assert len(set(sample)) == 10
+    assert all(i % 2 == 0 for i in sample)
+
+
+def test_reservoir_sample_smaller_population():
+    sample = asyncio.run(reservoir_sample(aiter_range(3), 10))
+    assert sorted(sample) == [0, 1, 2]
+
+
+def test_reservoir_sample_is_uniform():
+    counts: Counter[int] = Counter()
+    for _ in range(2000):
+        counts.update(asyncio.run(reservoir_sample(aiter_range(10), 2)))
+    assert all(300 < counts[i] < 500 for i in range(10))
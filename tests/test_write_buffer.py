@@ -0,0 +1,84 @@
+import asyncio
+
+from lambo.utils.write_buffer import WriteBehindBuffer
+
+
+def test_flushes_when_full():
+    async def run():
+        batches: list[list[int]] = []
+
+        async def flush(items: list[int]) -> None:
+            batches.append(items)
+
+        buffer = WriteBehindBuffer(flush, max_size=3, max_delay=60)
+        buffer.extend([1, 2])
+        await asyncio.sleep(0)
+        assert batches == []
+        buffer.extend([3])
+        await asyncio.sleep(0)
+        assert batches == [[1, 2, 3]]
+        assert buffer.depth == 0
+        assert buffer.stats.flushed_items == 3
+
+    asyncio.run(run())
+
+
+def test_flushes_after_delay_and_on_close():
+    async def run():
+        batches: list[list[int]] = []
+
+        async def flush(items: list[int]) -> None:
+            batches.append(items)
+
+        buffer = WriteBehindBuffer(flush, max_size=100, max_delay=0.01)
+        buffer.extend([1])
+        await asyncio.sleep(0.05)
+        assert batches == [[1]]
+        buffer.extend([2])
+        await buffer.close()
+        assert batches == [[1], [2]]
+
+    asyncio.run(run())
+
+
+def test_failed_flush_keeps_items():
+    async def run():
+        async def flush(items: list[int]) -> None:
+            raise RuntimeError("database is locked")
+
+        buffer = WriteBehindBuffer(flush, max_size=100, max_delay=60)
+        buffer.extend([1, 2])
+        try:
+            await buffer.flush()
+        except RuntimeError:
+            pass
+        assert buffer.depth == 2
+        assert buffer.stats.failed_flushes == 1
+
+    asyncio.run(run())
+
+
+def test_failed_flush_backs_off_and_caps_retained_items():
+    async def run():
+        attempts: list[list[int]] = []
+
+        async def flush(items: list[int]) -> None:
+            attempts.append(items)
+            if len(attempts) == 1:
+                raise RuntimeError("database is locked")
+
+        buffer = WriteBehindBuffer(flush, max_size=2, max_delay=0.02, max_retained=3)
+        buffer.extend([1, 2])
+        await asyncio.sleep(0)
+        assert attempts == [[1, 2]]
+        # Full again, but the retry waits for the backoff instead of firing.
+        buffer.extend([3, 4])
+        await asyncio.sleep(0)
+        assert len(attempts) == 1
+        assert buffer.depth == 3
+        assert buffer.stats.dropped_items == 1
+        await asyncio.sleep(0.1)
+        assert attempts[1] == [2, 3, 4]
+        assert buffer.depth == 0
+
+    asyncio.run(run())